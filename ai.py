@@ -8,6 +8,8 @@ from collections import defaultdict, deque
 import pymunk
 from pymunk import Vec2d
 import gameobjects
+import lineofsight
+import pathfinding
 
 # NOTE: use only 'map0' during development!
 
@@ -35,16 +37,26 @@ class Ai:
     """
     A simple ai that finds the shortest path to the target using
     a breadth first search. Also capable of shooting other tanks and or wooden
-    boxes.
+    boxes. The search results are shared between the AIs through flow_fields,
+    and the raycasts through line_of_sight.
     """
 
-    def __init__(self, tank, game_objects_list, tanks_list, bullets_list, space, currentmap, FRAMERATE, coop, ai_contoll):
+    def __init__(self, tank, game_objects_list, tanks_list, bullets_list, space, currentmap, FRAMERATE, coop, ai_contoll, flow_fields=None, line_of_sight=None, visibility=None):
         self.tank = tank
         self.game_objects_list = game_objects_list
         self.tanks_list = tanks_list
         self.bullets_list = bullets_list
         self.space = space
         self.currentmap = currentmap
+        if flow_fields is None:
+            flow_fields = pathfinding.FlowFields(currentmap)
+        self.flow_fields = flow_fields
+        self.own_line_of_sight = line_of_sight is None  # If no one else starts the ticks of it, we do
+        if line_of_sight is None:
+            line_of_sight = lineofsight.LineOfSight(space, tanks_list, bullets_list=bullets_list)
+        self.line_of_sight = line_of_sight
+        self.visibility = visibility  # Knows the rays that can not find anything, they are not cast
+        self.skipped_rays = 0  # Rays not cast because nothing could be seen, for profiling
         self.flag = None
         self.max_x = currentmap.width - 1
         self.max_y = currentmap.height - 1
@@ -56,12 +68,32 @@ class Ai:
         self.move_atemps = 0
         self.allow_metal = False
         self.target_tile = None
+        self.scheduler = None  # The aischeduler.AiScheduler that decides when the AI plans, if any
+        self.plan_pending = False  # Whether the AI waits for the scheduler to plan its path
+        self.planned_path = None
+        self.start_delay = 0  # Ticks the AI waits before it starts moving in a round
         self.ai_contoll = ai_contoll
         if self.ai_contoll:
             self.tank.make_ai(self, True)
         else:
             self.tank.make_ai(self, False)
 
+    def reset(self):
+        """
+        Forgets the path and the plan of the AI, for a new round.
+        """
+        self.path = deque()
+        self.move_cycle = self.move_cycle_gen()
+        self.update_grid_pos()
+        self.last_dif = None
+        self.move_atemps = 0
+        self.allow_metal = False
+        self.target_tile = None
+        if self.scheduler is not None:
+            self.scheduler.cancel(self)
+        self.plan_pending = False
+        self.planned_path = None
+
     def update_grid_pos(self):
         """
         This should only be called in the beginning, or at the end of a move_cycle.
@@ -77,26 +109,18 @@ class Ai:
 
     def maybe_shoot(self):
         """
-        Makes a raycast query in front of the tank. If another tank
+        Looks at what is in front of the tank. If another tank
         or a wooden box is found, then we shoot.
         """
         if self.ai_contoll:
-            start = (
-                self.tank.body.position + (0.3 * math.cos(self.tank.body.angle + math.pi / 2),
-                                           (0.3 * math.sin(self.tank.body.angle + math.pi / 2)))
-            )
-            end = (
-                self.tank.body.position + (100 * math.cos(self.tank.body.angle + math.pi / 2),
-                                           (100 * math.sin(self.tank.body.angle + math.pi / 2)))
-            )
-            target = (self.space.segment_query_first(start, end, 0, pymunk.ShapeFilter()))
-            shape = (hasattr(target, "shape"))
-            parent = shape and (hasattr(target.shape, "parent"))
-            destructable = parent and (hasattr(target.shape.parent, "destructable") and target.shape.parent.destructable)
-            Tank = parent and (hasattr(target.shape.parent, "is_tank"))
-            not_coop = (self.tank.team is None)
-            coop = (Tank and hasattr(target.shape.parent, "team") and (target.shape.parent.team != self.tank.team))
-            if destructable or (Tank and (not_coop or coop)):
+            if self.visibility is not None and self.visibility.nothing_to_shoot(self.tank):
+                self.skipped_rays += 1
+                return  # No enemy and no wood box in view, the ray could not find anything to shoot
+            if self.own_line_of_sight:
+                self.line_of_sight.begin_tick()
+            seen = self.line_of_sight.sight(self.tank)
+            enemy = seen.kind == lineofsight.TANK and (self.tank.team is None or seen.team != self.tank.team)
+            if seen.destructable or enemy:
                 self.tank.shoot(self.bullets_list, self.space, self.FRAMERATE)
 
     def move_cycle_gen(self):
@@ -113,8 +137,10 @@ class Ai:
                 yield
                 self.path = path
                 self.update_grid_pos()
+        for tick in range(self.start_delay):
+            yield
         while True:
-            path = self.find_shortest_path()
+            path = yield from self.wait_for_plan()
             if not path:
                 yield
                 continue  # Start from the top of our cycle
@@ -133,6 +159,27 @@ class Ai:
             self.tank.stop_moving()
             self.update_grid_pos()
 
+    def wait_for_plan(self):
+        """
+        Returns the shortest path to the target. With a scheduler, the path is found
+        when the scheduler has time for it: this yields until then, and the AI keeps
+        shooting meanwhile.
+        """
+        if self.scheduler is None:
+            return self.find_shortest_path()
+        self.plan_pending = True
+        self.scheduler.request(self)
+        while self.plan_pending:
+            yield
+        return self.planned_path
+
+    def plan(self):
+        """
+        Finds the path the AI waits for, called by the scheduler.
+        """
+        self.planned_path = self.find_shortest_path()
+        self.plan_pending = False
+
     def turn(self, next_coord):
         """
         Compares angle between tank and next_coord and starts turning if tank is not facing the correct way
@@ -177,29 +224,13 @@ class Ai:
 
     def find_shortest_path(self):
         """
-        A simple Breadth First Search using integer coordinates as our nodes.
-        Edges are calculated as we go, using an external function.
+        Follows the shared distance field of the target tile (a breadth first
+        search from the target) downhill from our position.
         """
-        queue = deque()
-        queue.append(self.grid_pos)
-        visited = set()
-        came_from = {}
-        shortest_path = []
-        visited.add(self.grid_pos.int_tuple)
-        while queue:
-            node = queue.popleft()
-            if node == self.get_target_tile():
-                while node in came_from:
-                    shortest_path.append(node)
-                    node = came_from[node]
-                shortest_path.reverse()
-                return deque(shortest_path)
-            for neighbor in self.get_tile_neighbors(node):
-                if neighbor not in visited:
-                    queue.append(neighbor)
-                    visited.add(neighbor.int_tuple)
-                    came_from[neighbor] = node
-        self.allow_metal = True
+        path = self.flow_fields.path(self.grid_pos, self.get_target_tile(), self.allow_metal)
+        if path is None:
+            self.allow_metal = True
+        return path
 
     def get_target_tile(self):
         """
@@ -246,28 +277,3 @@ class Ai:
         """
         x, y = position_vector
         return Vec2d(int(x), int(y))
-
-    def get_tile_neighbors(self, coord_vec):
-        """
-        Returns all bordering grid squares of the input coordinate.
-        A bordering square is only considered accessible if it is grass
-        or a wooden box.
-        """
-        neighbors = []  # Find the coordinates of the tiles' four neighbors
-        neighbors.append(coord_vec + (0, -1))  # upp
-        neighbors.append(coord_vec + (0, 1))  # down
-        neighbors.append(coord_vec + (-1, 0))  # left
-        neighbors.append(coord_vec + (1, 0))  # right
-        return filter(self.filter_tile_neighbors, neighbors)
-
-    def filter_tile_neighbors(self, coord):
-        """
-        Used to filter the tile to check if it is a neighbor of the tank.
-        """
-        if (0 <= coord.x <= self.max_x) and (0 <= coord.y <= self.max_y):
-            is_alowed = False
-            is_alowed = is_alowed or self.currentmap.boxAt(coord.x, coord.y) == 0
-            is_alowed = is_alowed or self.currentmap.boxAt(coord.x, coord.y) == 2
-            is_alowed = is_alowed or (self.currentmap.boxAt(coord.x, coord.y) == 3 and self.allow_metal)
-            return is_alowed
-        return False
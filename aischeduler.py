@@ -0,0 +1,132 @@
+"""
+Shares the path planning of the AIs between ticks. Every tick each AI steers
+and shoots, which is cheap, but an AI that needs a new path only asks for it;
+the scheduler then plans the waiting AIs, most urgent first, until the work of
+the tick reaches its budget. The others keep waiting, and shooting, until a
+following tick, so many AIs planning at once no longer make one tick slow.
+
+The budget counts the tiles the path searches go through (see
+FlowFields.expanded) rather than seconds, so the game stays deterministic and
+replays and seeded matches play the same on every machine. The time each plan
+took is measured for the report only.
+
+With a pathplanner.PathPlanner, an AI whose distance field is not known yet
+keeps waiting while the field is searched in the background.
+"""
+import time
+
+import pathfinding
+
+BUDGET = 1500  # Tiles the searches may go through in one tick, after the first plan of the tick
+MAX_WAIT = 10  # Ticks after which a waiting AI comes first, whatever its priority
+
+
+class AiScheduler:
+    """
+    Runs the AIs of a session and decides which of them plan each tick.
+    """
+
+    def __init__(self, ai_list, flow_fields, budget=BUDGET, planner=None):
+        """
+        Takes as argument the AIs, the path finding they share, the budget of a
+        tick (None for no limit, every AI plans as soon as it asks) and the planner
+        that searches new fields in the background, if any.
+        """
+        self.ai_list = ai_list
+        self.flow_fields = flow_fields
+        self.budget = budget
+        self.planner = planner
+        self.pending = {}  # The tick each waiting AI asked for a plan on
+        self.tick = 0
+        self.stats = {}  # Plans, ticks waited and time spent planning, per AI
+
+    def add(self, my_ai):
+        """
+        Makes an AI plan through the scheduler.
+        """
+        my_ai.scheduler = self
+        self.stats[my_ai] = {"plans": 0, "wait": 0, "max_wait": 0, "time": 0.0, "max_time": 0.0}
+
+    def request(self, my_ai):
+        """
+        Called by an AI that needs a path.
+        """
+        self.pending[my_ai] = self.tick
+
+    def cancel(self, my_ai):
+        """
+        Forgets the request of an AI that was reset.
+        """
+        self.pending.pop(my_ai, None)
+
+    def urgent(self, my_ai):
+        """
+        An AI is urgent if it carries the flag or chases the tank that does, or if a
+        box moved onto the rest of its previous path.
+        """
+        if any(tank.flag is not None for tank in my_ai.tanks_list):
+            return True
+        grid = self.flow_fields.grid
+        return any(not pathfinding.is_passable(grid.boxAt(int(tile[0]), int(tile[1])), my_ai.allow_metal)
+                   for tile in my_ai.path)
+
+    def priority(self, my_ai):
+        """
+        Returns the key the waiting AIs are sorted on: those that waited MAX_WAIT
+        ticks first, then the urgent ones, then the longest waiting.
+        """
+        waited = self.tick - self.pending[my_ai]
+        return (waited < MAX_WAIT, not self.urgent(my_ai), -waited, self.ai_list.index(my_ai))
+
+    def run(self, tick):
+        """
+        Runs the AIs for one tick: every AI decides, then the waiting AIs plan, at
+        least one whose field is known and then as many as the budget allows. An AI
+        that gets its path goes on with its move right away, as if it had not waited.
+        """
+        self.tick = tick
+        if self.planner is not None:
+            self.planner.deliver(tick)
+        for my_ai in self.ai_list:
+            my_ai.decide()
+        self.flow_fields.trim_changes(self.planner.oldest_version() if self.planner is not None else None)
+        if not self.pending:
+            return
+        spent = 0
+        for my_ai in sorted(self.pending, key=self.priority):
+            if self.budget is not None and spent >= self.budget:
+                break
+            if self.planner is not None and not self.planner.ready(my_ai, tick):
+                continue  # Its field is being searched
+            expanded = self.flow_fields.expanded
+            start = time.perf_counter()
+            my_ai.plan()
+            next(my_ai.move_cycle)
+            elapsed = time.perf_counter() - start
+            spent += max(self.flow_fields.expanded - expanded, 1)
+            waited = tick - self.pending.pop(my_ai)
+            stats = self.stats[my_ai]
+            stats["plans"] += 1
+            stats["wait"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+            stats["time"] += elapsed
+            stats["max_time"] = max(stats["max_time"], elapsed)
+
+    def report(self):
+        """
+        Returns the decision latency of each AI, in the order of the tanks: the number
+        of plans, the mean and longest wait for a plan (in ticks) and the mean and
+        longest time a plan took (in seconds).
+        """
+        report = []
+        for my_ai in self.ai_list:
+            stats = self.stats[my_ai]
+            plans = max(stats["plans"], 1)
+            report.append({
+                "plans": stats["plans"],
+                "wait_mean": stats["wait"] / plans,
+                "wait_max": stats["max_wait"],
+                "time_mean": stats["time"] / plans,
+                "time_max": stats["max_time"],
+            })
+        return report
@@ -0,0 +1,182 @@
+"""
+Command line runner that plays many headless all AI matches in parallel and
+prints one summary of the results.
+
+Example:
+    python3 batch.py --maps map0 map1 --matches 1000 --win-condition best_of_5 --hard-ai
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import time
+
+import aischeduler
+import simulation
+import maps
+import profiling
+import sounds
+
+sounds.muted = True  # The matches are played without audio
+
+WIN_CONDITIONS = ["best_of_5", "time_limit", "rounds_fired", "freeplay"]
+MAX_TICKS = 10000  # A match is stopped after this many ticks, even if no win condition is reached
+
+
+def play_match(job):
+    """
+    Plays one headless match, round after round, until the win condition is reached.
+    The seed sets when the AIs start each round, the only thing that varies between
+    the matches of a map (see simulation.START_JITTER).
+    Every worker process has its own session and therefore its own pymunk space.
+    Returns a dictionary with the result of the match.
+    """
+    map_name, win_condition, hard_ai, seed, max_ticks, vectorized, kinematic_bullets, profile_dir, ai_budget = job
+    profiler = profiling.Profiler() if profile_dir else None
+    current_map = maps.load_map(map_name)
+    scores = [0] * 6
+    capture_times = []
+    session = simulation.GameSession(current_map, all_ai=True, hard_ai=hard_ai, scores=scores,
+                                     vectorized=vectorized, kinematic_bullets=kinematic_bullets, profiler=profiler,
+                                     ai_budget=ai_budget, seed=seed)
+    while True:
+        round_start = session.ticks
+        while session.winner is None and not session.match_over(win_condition) and session.ticks < max_ticks:
+            session.step(1)
+        if session.winner is not None:
+            capture_times.append(session.ticks - round_start)
+        if session.winner is None or session.match_over(win_condition) or win_condition == "freeplay":
+            break
+        session.restore()  # The next round starts from the spawned map, without building it again
+    ticks = session.ticks
+    rounds_fired = session.total_rounds_fired()
+    if profiler is not None:
+        name = os.path.join(profile_dir, f"{map_name}-{seed}")
+        profiler.write_csv(name + ".csv")
+        profiler.write_json(name + ".json")
+    return {
+        "map": map_name,
+        "seed": seed,
+        "scores": scores[:len(current_map.start_positions)],
+        "capture_times": capture_times,
+        "total_rounds_fired": rounds_fired,
+        "ticks": ticks,
+        "timed_out": ticks >= max_ticks,
+        "profile": profiler.summary() if profiler is not None else None,
+        "ai_latency": session.ai_scheduler.report(),
+    }
+
+
+def summarize(results):
+    """
+    Aggregates the results of many matches into one summary per map.
+    """
+    summary = {}
+    for result in results:
+        entry = summary.setdefault(result["map"], {
+            "matches": 0,
+            "timed_out": 0,
+            "ticks": 0,
+            "total_rounds_fired": 0,
+            "scores": [0] * len(result["scores"]),
+            "match_wins": [0] * len(result["scores"]),
+            "capture_times": [],
+            "phases": {},
+            "ai_wait": [0] * len(result["scores"]),  # Ticks the AIs waited for their plans
+            "ai_plans": [0] * len(result["scores"]),
+            "ai_wait_max": [0] * len(result["scores"]),
+            "ai_time_max": [0.0] * len(result["scores"]),
+        })
+        entry["matches"] += 1
+        entry["timed_out"] += result["timed_out"]
+        entry["ticks"] += result["ticks"]
+        entry["total_rounds_fired"] += result["total_rounds_fired"]
+        entry["capture_times"] += result["capture_times"]
+        for phase, timing in (result["profile"] or {}).items():
+            phase_entry = entry["phases"].setdefault(phase, {"total": 0.0, "p95": []})
+            phase_entry["total"] += timing["total"]
+            phase_entry["p95"].append(timing["p95"])
+        for index, score in enumerate(result["scores"]):
+            entry["scores"][index] += score
+        for index, latency in enumerate(result["ai_latency"]):
+            entry["ai_wait"][index] += latency["wait_mean"] * latency["plans"]
+            entry["ai_plans"][index] += latency["plans"]
+            entry["ai_wait_max"][index] = max(entry["ai_wait_max"][index], latency["wait_max"])
+            entry["ai_time_max"][index] = max(entry["ai_time_max"][index], latency["time_max"])
+        if max(result["scores"]) > 0:
+            for index, score in enumerate(result["scores"]):
+                if score == max(result["scores"]):
+                    entry["match_wins"][index] += 1
+    for entry in summary.values():
+        times = entry.pop("capture_times")
+        entry["captures"] = len(times)
+        entry["capture_time_mean"] = statistics.mean(times) if times else None
+        entry["capture_time_median"] = statistics.median(times) if times else None
+        entry["capture_time_min"] = min(times) if times else None
+        entry["capture_time_max"] = max(times) if times else None
+        entry["rounds_fired_per_match"] = entry["total_rounds_fired"] / entry["matches"]
+        entry["ai_wait_mean"] = [wait / max(plans, 1) for wait, plans in zip(entry.pop("ai_wait"), entry["ai_plans"])]
+        total = sum(phase["total"] for phase in entry["phases"].values()) or 1.0
+        for phase in entry["phases"].values():
+            phase["share"] = phase["total"] / total
+            phase["p95"] = statistics.median(phase["p95"])  # Median over the matches of the p95 of each match
+    return summary
+
+
+def print_summary(summary, elapsed):
+    """
+    Prints the summary in a readable form.
+    """
+    for map_name, entry in summary.items():
+        print(f"{map_name}: {entry['matches']} matches, {entry['timed_out']} timed out, {entry['ticks']} ticks")
+        for index, score in enumerate(entry["scores"]):
+            print(f"    Tank {index + 1}: {score} captures, {entry['match_wins'][index]} match wins,"
+                  f" AI waited {entry['ai_wait_mean'][index]:.2f} ticks per plan (max {entry['ai_wait_max'][index]}),"
+                  f" longest plan {entry['ai_time_max'][index] * 1000:.2f} ms")
+        if entry["captures"]:
+            print(f"    Capture time (ticks): mean {entry['capture_time_mean']:.1f}, median {entry['capture_time_median']},"
+                  f" min {entry['capture_time_min']}, max {entry['capture_time_max']}")
+        print(f"    Rounds fired: {entry['total_rounds_fired']} ({entry['rounds_fired_per_match']:.1f} per match)")
+        for phase, timing in sorted(entry["phases"].items(), key=lambda item: -item[1]["total"]):
+            print(f"    {phase:<14} {timing['share'] * 100:5.1f} % of the time, p95 {timing['p95'] * 1e6:8.1f} us per tick")
+    total_ticks = sum(entry["ticks"] for entry in summary.values())
+    print(f"Played in {elapsed:.1f} s ({total_ticks / max(elapsed, 1e-9):.0f} ticks/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play headless all AI matches in parallel.")
+    parser.add_argument("--maps", nargs="+", default=["map0", "map1", "map2", "map3"], help="names of the maps in maps/")
+    parser.add_argument("--matches", type=int, default=10, help="number of matches per map")
+    parser.add_argument("--win-condition", choices=WIN_CONDITIONS, default="best_of_5")
+    parser.add_argument("--hard-ai", action="store_true", help="use the unfair AI")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first match, the following matches use seed + 1, ...")
+    parser.add_argument("--max-ticks", type=int, default=MAX_TICKS, help="ticks after which a match is stopped")
+    parser.add_argument("--vectorized", action="store_true", help="update the tanks with NumPy")
+    parser.add_argument("--kinematic-bullets", action="store_true", help="move the bullets with NumPy instead of pymunk")
+    parser.add_argument("--ai-budget", type=int, default=aischeduler.BUDGET,
+                        help="path finding work (tiles searched) the AIs may do per tick, 0 for no limit")
+    parser.add_argument("--profile", metavar="DIR", help="time the phases of every tick and write the profile of each match to DIR")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: one per core)")
+    parser.add_argument("--json", help="also write the summary to this file")
+    args = parser.parse_args()
+
+    jobs = [(map_name, args.win_condition, args.hard_ai, args.seed + index, args.max_ticks, args.vectorized,
+             args.kinematic_bullets, args.profile, args.ai_budget or None)
+            for map_name in args.maps for index in range(args.matches)]
+    if args.profile:
+        os.makedirs(args.profile, exist_ok=True)
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.workers) as pool:
+        results = list(pool.imap_unordered(play_match, jobs, chunksize=max(1, len(jobs) // 256)))
+    elapsed = time.perf_counter() - start
+
+    summary = summarize(results)
+    print_summary(summary, elapsed)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(summary, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+Optional kinematic engine for the bullets of a game. The bullets are not
+simulated by pymunk: their positions and velocities are kept in NumPy arrays
+and moved for every bullet at once, and what they hit is found with swept
+segment queries, so a fast bullet can not tunnel through a thin object and the
+physics solver never sees the bullets.
+
+A bullet flies in a straight line, so the boxes and walls in its way only need
+to be looked for once, when it is shot: the query is repeated only for the
+bullets whose path crosses a box that moved or was destroyed. Tanks move all
+the time and are looked for every frame, but only by the bullets that are
+close to one. Unlike pymunk bullets, bullets do not bounce off each other.
+Needs NumPy, which is not a requirement of the game.
+"""
+import math
+
+import pymunk
+import images
+import gameobjects
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+CAPACITY = 64  # Number of bullets the arrays can hold before they are grown
+EPSILON = 1e-6  # Margin added around the boxes that moved, against rounding errors
+CHUNK = 2.0  # Length of the parts of a path that are searched for shapes at once
+
+#  What a bullet can hit: the scenery (boxes and walls) and the tanks
+SCENERY_FILTER = pymunk.ShapeFilter(mask=pymunk.ShapeFilter.ALL_MASKS() ^ gameobjects.BULLET_CATEGORY ^ gameobjects.TANK_CATEGORY)
+TANK_FILTER = pymunk.ShapeFilter(mask=gameobjects.TANK_CATEGORY)
+
+
+def paths_cross_box(origin, direction, length, box):
+    """
+    Returns which of the segments, starting at origin and going length along
+    direction (one row per segment), cross the box (left, bottom, right, top).
+    """
+    left, bottom, right, top = box
+    enter = numpy.zeros(len(origin))
+    leave = numpy.array(length, dtype=float)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        for axis, low, high in ((0, left, right), (1, bottom, top)):
+            start = origin[:, axis]
+            step = direction[:, axis]
+            near = (low - start) / step
+            far = (high - start) / step
+            #  A segment parallel to the sides is inside or outside for its whole length
+            parallel = step == 0
+            inside = (start >= low) & (start <= high)
+            near = numpy.where(parallel, numpy.where(inside, -numpy.inf, numpy.inf), near)
+            far = numpy.where(parallel, numpy.where(inside, numpy.inf, -numpy.inf), far)
+            enter = numpy.maximum(enter, numpy.minimum(near, far))
+            leave = numpy.minimum(leave, numpy.maximum(near, far))
+    return enter <= leave
+
+
+class BulletEngine:
+    """
+    Moves the bullets of a session and hands what they hit to the session,
+    the same way the bullet collision handlers do.
+    """
+
+    def __init__(self, session, capacity=CAPACITY):
+        """
+        Takes as argument the session the bullets are shot in.
+        """
+        if numpy is None:
+            raise ImportError("BulletEngine needs numpy, install it with 'pip install numpy'")
+        self.session = session
+        #  The bodies of the bullets only hold the pose that is drawn, they are kept
+        #  in a space of their own that is never stepped
+        self.space = pymunk.Space()
+        self.radius = 0.5 * min(images.bullet.get_width(), images.bullet.get_height()) / images.TILE_SIZE
+        self.reach = math.hypot(session.current_map.width, session.current_map.height) + 1
+        self.position = numpy.zeros((capacity, 2))
+        self.velocity = numpy.zeros((capacity, 2))
+        self.base_velocity = numpy.zeros((capacity, 2))  # Velocity given back to the bullets every tick
+        self.direction = numpy.zeros((capacity, 2))
+        self.travelled = numpy.zeros(capacity)  # Distance flown since the bullet was shot
+        self.limit = numpy.zeros(capacity)  # Distance at which the bullet hits the scenery
+        self.bullets = []  # The Bullet in each row of the arrays
+        self.blockers = []  # The shape of the scenery each bullet will hit, or None
+        self.index = {}  # The row of each bullet
+        self.boxes = None  # The shapes of the boxes that can move
+        self.scenery = None  # The bounding box of every box that can move, while bullets are flying
+        self.scattered = True  # Whether the bodies of the bullets are where the arrays say
+        self.queries = 0  # Number of segment and point queries, for profiling
+
+    def fire(self, tank):
+        """
+        Shoots a bullet from the tank and returns it. Like a pymunk bullet, it
+        does not move until the next tick gives it its speed.
+        """
+        if self.scenery is None:
+            self.scenery = self.movable_boxes()
+        bullet = self.session.bullet_pool.acquire(tank, self.space)
+        row = len(self.bullets)
+        if row == len(self.position):
+            self.grow()
+        angle = tank.body.angle + math.pi / 2
+        self.position[row] = tuple(bullet.body.position)
+        self.velocity[row] = 0, 0
+        self.direction[row] = math.cos(angle), math.sin(angle)
+        self.base_velocity[row] = self.direction[row] * bullet.bullet_speed
+        self.travelled[row] = 0
+        self.bullets.append(bullet)
+        self.blockers.append(None)
+        self.index[bullet] = row
+        self.cast(row, self.position[row], 0)
+        return bullet
+
+    def grow(self):
+        """
+        Doubles the size of the arrays.
+        """
+        for name in ("position", "velocity", "base_velocity", "direction", "travelled", "limit"):
+            array = getattr(self, name)
+            setattr(self, name, numpy.concatenate([array, numpy.zeros_like(array)]))
+
+    def remove(self, bullet):
+        """
+        Removes a bullet from the arrays, the last bullet takes its row.
+        """
+        row = self.index.pop(bullet, None)
+        if row is None:
+            return
+        last = len(self.bullets) - 1
+        if row != last:
+            moved = self.bullets[last]
+            self.bullets[row] = moved
+            self.blockers[row] = self.blockers[last]
+            self.index[moved] = row
+            for array in (self.position, self.velocity, self.base_velocity, self.direction, self.travelled, self.limit):
+                array[row] = array[last]
+        self.bullets.pop()
+        self.blockers.pop()
+
+    def first_contact(self, point, direction, length, shape_filter):
+        """
+        Returns (distance, shape) for the first shape a bullet touches when it flies
+        length from point along direction, or None if it touches nothing.
+        """
+        self.queries += 1
+        space = self.session.space
+        hit = space.point_query_nearest(point, self.radius, shape_filter)
+        if hit is not None:
+            return 0, hit.shape
+        x, y = point
+        dx, dy = direction
+        hit = space.segment_query_first(point, (x + dx * length, y + dy * length), self.radius, shape_filter)
+        best = (hit.alpha * length, hit.shape) if hit is not None else None
+        #  The space only looks at the shapes whose bounding box the center of the
+        #  bullet crosses, a shape that is only grazed is missed. The path up to
+        #  the first hit is searched again with the bounding box of the bullet.
+        searched = 0
+        end = best[0] if best is not None else length
+        while searched < end:
+            chunk = min(CHUNK, end - searched)
+            a = (x + dx * searched, y + dy * searched)
+            b = (x + dx * (searched + chunk), y + dy * (searched + chunk))
+            bb = pymunk.BB(min(a[0], b[0]) - self.radius, min(a[1], b[1]) - self.radius,
+                           max(a[0], b[0]) + self.radius, max(a[1], b[1]) + self.radius)
+            found = None
+            for shape in space.bb_query(bb, shape_filter):
+                hit = shape.segment_query(a, b, self.radius)
+                if hit.shape is not None and (found is None or hit.alpha * chunk < found[0]):
+                    found = (hit.alpha * chunk, shape)
+            if found is not None:
+                return searched + found[0], found[1]
+            searched += chunk
+        return best
+
+    def cast(self, row, point, travelled):
+        """
+        Looks for the scenery in the way of a bullet that is at point and has
+        flown the distance travelled.
+        """
+        contact = self.first_contact(tuple(point), tuple(self.direction[row]), self.reach, SCENERY_FILTER)
+        if contact is not None:
+            self.limit[row] = travelled + contact[0]
+            self.blockers[row] = contact[1]
+        else:
+            self.limit[row] = math.inf
+            self.blockers[row] = None
+
+    def movable_boxes(self):
+        """
+        Returns the bounding box (left, bottom, right, top) of every box that can move.
+        """
+        if self.boxes is None:
+            self.boxes = [shape for shape in self.session.space.shapes
+                          if shape.collision_type == gameobjects.BOX_COLLISION_TYPE and shape.body.body_type != pymunk.Body.STATIC]
+        self.boxes = [shape for shape in self.boxes if shape.space is not None]  # Destroyed boxes are left out
+        boxes = {}
+        for shape in self.boxes:
+            bb = shape.bb
+            boxes[shape] = (bb.left, bb.bottom, bb.right, bb.top)
+        return boxes
+
+    def moved_scenery(self):
+        """
+        Returns the bounding boxes, before and after, of the boxes that moved or
+        were removed since the last frame.
+        """
+        changed = []
+        scenery = self.movable_boxes()
+        for shape, box in scenery.items():
+            previous = self.scenery.get(shape)
+            if previous != box:
+                changed.append(box)
+                if previous is not None:
+                    changed.append(previous)
+        for shape, box in self.scenery.items():
+            if shape not in scenery:
+                changed.append(box)
+        self.scenery = scenery
+        return changed
+
+    def update(self):
+        """
+        Gives every bullet its speed back, replaces calling Bullet.update on each of them.
+        """
+        count = len(self.bullets)
+        self.velocity[:count] = self.base_velocity[:count]
+
+    def step(self, dt):
+        """
+        Moves every bullet one physics frame and resolves what they hit. Like
+        pymunk, the bullets are moved before their velocity is damped.
+        """
+        count = len(self.bullets)
+        if count == 0:
+            self.scenery = None  # Nothing to keep up to date until the next bullet
+            return
+        changed = self.moved_scenery()
+        start = self.position[:count].copy()
+        before = self.travelled[:count].copy()
+        moves = self.velocity[:count] * dt
+        lengths = numpy.hypot(moves[:, 0], moves[:, 1])
+        self.position[:count] += moves
+        self.travelled[:count] += lengths
+        self.velocity[:count] *= self.session.space.damping ** dt
+
+        #  The bullets whose path crosses a box that moved look for the scenery again
+        if changed:
+            remaining = numpy.minimum(self.limit[:count] - before, self.reach)
+            recast = numpy.zeros(count, dtype=bool)
+            margin = self.radius + EPSILON
+            for left, bottom, right, top in changed:
+                box = (left - margin, bottom - margin, right + margin, top + margin)
+                recast |= paths_cross_box(start, self.direction[:count], remaining, box)
+            for row in numpy.flatnonzero(recast).tolist():
+                self.cast(row, start[row], before[row])
+
+        #  The distance flown in this frame before touching something, and what was touched
+        touched = {}
+        for row in numpy.flatnonzero(self.travelled[:count] >= self.limit[:count]).tolist():
+            touched[row] = (max(self.limit[row] - before[row], 0), self.blockers[row])
+        for row in self.near_tanks(self.position[:count], lengths).tolist():
+            contact = self.first_contact(tuple(start[row]), tuple(self.direction[row]), lengths[row], TANK_FILTER)
+            if contact is not None and (row not in touched or contact[0] < touched[row][0]):
+                touched[row] = contact
+
+        hits = []
+        for row, (distance, shape) in sorted(touched.items()):
+            #  Where the center of the bullet was when it touched the shape
+            hits.append((self.bullets[row], shape, tuple(start[row] + self.direction[row] * distance)))
+        for bullet, shape, point in hits:
+            bullet.body.position = point
+            self.hit(bullet, shape)
+        self.scattered = False
+        if self.session.interpolate:
+            self.scatter()
+
+    def near_tanks(self, position, lengths):
+        """
+        Returns the rows of the bullets that ended the frame closer to a tank than
+        their radius and the length of their move, the only ones that could have touched it.
+        """
+        boxes = numpy.array([tuple(tank.shape.bb) for tank in self.session.tanks_list]).reshape(-1, 4)
+        x = position[:, 0, None]
+        y = position[:, 1, None]
+        dx = numpy.maximum(numpy.maximum(boxes[:, 0] - x, x - boxes[:, 2]), 0)
+        dy = numpy.maximum(numpy.maximum(boxes[:, 1] - y, y - boxes[:, 3]), 0)
+        reach = (lengths + self.radius)[:, None]
+        return numpy.flatnonzero((dx * dx + dy * dy <= reach * reach).any(axis=1))
+
+    def hit(self, bullet, shape):
+        """
+        Calls the session for what the bullet hit.
+        """
+        if shape.collision_type == gameobjects.TANK_COLLISION_TYPE:
+            self.session.bullet_hit_tank(bullet, shape.parent)
+        elif shape.collision_type == gameobjects.BOX_COLLISION_TYPE:
+            self.session.bullet_hit_box(bullet, shape.parent)
+        else:
+            self.session.bullet_hit_wall(bullet)
+
+    def scatter(self):
+        """
+        Copies the positions back to the bodies of the bullets, for drawing.
+        """
+        positions = self.position[:len(self.bullets)].tolist()
+        for row, bullet in enumerate(self.bullets):
+            bullet.body.position = positions[row]
+        self.scattered = True
+
+    def sync(self):
+        """
+        Copies the positions back to the bodies if they moved since the last copy.
+        A display that does not interpolate, or a snapshot, calls it before reading them.
+        """
+        if not self.scattered:
+            self.scatter()
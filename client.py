@@ -0,0 +1,210 @@
+"""
+Thin client of server.py: sends the keys of the player to the server and draws
+the snapshots it gets back, it runs no simulation of its own. With --bots it
+opens many headless connections that give commands and keep the state up to
+date without drawing, to test a server.
+
+Example:
+    python3 client.py --host 127.0.0.1 --port 5000
+    python3 client.py --port 5000 --bots 40 --seconds 30
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import pygame
+from pygame.locals import *
+
+import gameobjects
+import images
+import maps
+import network
+import replay
+import simulation
+
+RENDER_RATE = 60  # Frames drawn per second at most
+
+#  The command sent for each key pressed or released
+KEYDOWN_COMMANDS = {
+    K_UP: simulation.ACCELERATE,
+    K_DOWN: simulation.DECELERATE,
+    K_LEFT: simulation.TURN_LEFT,
+    K_RIGHT: simulation.TURN_RIGHT,
+    K_RSHIFT: simulation.SHOOT,
+}
+KEYUP_COMMANDS = {
+    K_UP: simulation.STOP_MOVING,
+    K_DOWN: simulation.STOP_MOVING,
+    K_LEFT: simulation.STOP_TURNING,
+    K_RIGHT: simulation.STOP_TURNING,
+}
+
+#  What the bots do, one command every BOT_INTERVAL seconds
+BOT_COMMANDS = [simulation.ACCELERATE, simulation.TURN_LEFT, simulation.SHOOT, simulation.STOP_TURNING,
+                simulation.SHOOT, simulation.DECELERATE, simulation.TURN_RIGHT, simulation.STOP_MOVING]
+BOT_INTERVAL = 0.25
+
+
+async def connect(host, port):
+    """
+    Connects to a server, returns the streams and the hello of the server.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    hello = await network.read_message(reader)
+    return reader, writer, hello
+
+
+async def receive(reader, states, counters):
+    """
+    Applies the snapshots of the server to states until the connection is closed.
+    counters counts the snapshots and bytes received.
+    """
+    try:
+        while True:
+            payload = await network.read_payload(reader)
+            message = json.loads(payload.decode('utf-8'))
+            network.apply_snapshot(states, message)
+            counters["snapshots"] += 1
+            counters["bytes"] += network.LENGTH.size + len(payload)
+            counters["tick"] = message["tick"]
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return
+
+
+def draw_static(current_map):
+    """
+    Returns the part of the screen that never changes: the floor, the rocks and the bases.
+    """
+    background = pygame.Surface(current_map.rect().size)
+    for x in range(current_map.width):
+        for y in range(current_map.height):
+            background.blit(images.grass, (x * images.TILE_SIZE, y * images.TILE_SIZE))
+            if current_map.boxAt(x, y) == 1:
+                background.blit(images.rockbox, (x * images.TILE_SIZE, y * images.TILE_SIZE))
+    for tank_index, position in enumerate(current_map.start_positions):
+        base = images.bases[tank_index]
+        background.blit(base, base.get_rect(center=gameobjects.physics_to_display(pygame.Vector2(position[0], position[1]))))
+    return background
+
+
+def entity_sprite(key, state):
+    """
+    Returns the sprite of an entity, before it is rotated.
+    """
+    kind = key[0]
+    if kind == network.TANK:
+        sprite = images.tanks[int(key[1:])]
+        sprite.set_alpha(128 if state[4] else 255)
+        return sprite
+    if kind == network.BULLET:
+        return images.bullet
+    if kind == network.WOOD_BOX:
+        return images.woodbox
+    if kind == network.METAL_BOX:
+        return images.metalbox
+    if kind == network.FLAG:
+        return images.flag
+    return images.explosion
+
+
+def draw(screen, static_layer, states):
+    """
+    Draws the entities on top of the static layer. The boxes are drawn first and the flag last.
+    """
+    screen.blit(static_layer, (0, 0))
+    for key in sorted((key for key in states if key[0] in network.DRAW_ORDER), key=lambda key: network.DRAW_ORDER[key[0]]):
+        sprite = entity_sprite(key, states[key])
+        x, y, angle = states[key][:3]
+        rotated = gameobjects.rotate_sprite(sprite, angle * gameobjects.ROTATION_STEP)
+        screen.blit(rotated, rotated.get_rect(center=(x, y)))
+
+
+async def play(host, port):
+    """
+    Plays on a server: draws the game and sends the keys of the player until the window is closed.
+    """
+    reader, writer, hello = await connect(host, port)
+    current_map = maps.load_map(hello["map"])
+    if replay.map_checksum(current_map) != hello["map_checksum"]:
+        raise SystemExit("The map %s of the server is not the same as ours" % hello["map"])
+    pygame.init()
+    screen = pygame.display.set_mode(current_map.rect().size)
+    tank = hello["tank"]
+    title = "Capture the flag - " + ("tank %d" % (tank + 1) if tank is not None else "spectator")
+    pygame.display.set_caption(title)
+    static_layer = draw_static(current_map)
+    states = {}
+    counters = {"snapshots": 0, "bytes": 0, "tick": 0}
+    receiving = asyncio.ensure_future(receive(reader, states, counters))
+    drawn = -1
+    running = True
+    while running and not receiving.done():
+        for event in pygame.event.get():
+            if event.type == QUIT or (event.type == KEYDOWN and event.key == K_ESCAPE):
+                running = False
+            elif event.type == KEYDOWN and event.key in KEYDOWN_COMMANDS:
+                writer.write(network.COMMAND.pack(KEYDOWN_COMMANDS[event.key]))
+            elif event.type == KEYUP and event.key in KEYUP_COMMANDS:
+                writer.write(network.COMMAND.pack(KEYUP_COMMANDS[event.key]))
+        if counters["snapshots"] != drawn:
+            draw(screen, static_layer, states)
+            if network.SCORES in states:
+                pygame.display.set_caption("%s - scores %s" % (title, states[network.SCORES]))
+            pygame.display.flip()
+            drawn = counters["snapshots"]
+        await asyncio.sleep(1 / RENDER_RATE)
+    writer.close()
+    receiving.cancel()
+
+
+async def bot(host, port, seconds, index, results):
+    """
+    A headless client that gives BOT_COMMANDS to its tank, if it got one, for seconds seconds.
+    """
+    reader, writer, hello = await connect(host, port)
+    states = {}
+    counters = {"snapshots": 0, "bytes": 0, "tick": 0}
+    receiving = asyncio.ensure_future(receive(reader, states, counters))
+    start = time.perf_counter()
+    step = index  # The bots do not all do the same thing at the same time
+    while time.perf_counter() - start < seconds and not receiving.done():
+        writer.write(network.COMMAND.pack(BOT_COMMANDS[step % len(BOT_COMMANDS)]))
+        step += 1
+        await asyncio.sleep(BOT_INTERVAL)
+    writer.close()
+    receiving.cancel()
+    results.append((hello["tank"], counters, len(states)))
+
+
+async def run_bots(host, port, count, seconds):
+    """
+    Connects count bots to a server and prints what each of them received.
+    """
+    results = []
+    await asyncio.gather(*(bot(host, port, seconds, index, results) for index in range(count)))
+    players = sum(tank is not None for tank, counters, entities in results)
+    snapshots = [counters["snapshots"] for tank, counters, entities in results]
+    received = sum(counters["bytes"] for tank, counters, entities in results)
+    print(f"{count} bots ({players} players, {count - players} spectators) for {seconds} s:"
+          f" {min(snapshots) / seconds:.1f} to {max(snapshots) / seconds:.1f} snapshots/s per bot,"
+          f" {received / count / seconds / 1024:.1f} KiB/s per bot,"
+          f" {sum(entities for tank, counters, entities in results) / count:.0f} entities in view")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play on a multiplayer server.")
+    parser.add_argument("--host", default="127.0.0.1", help="address of the server")
+    parser.add_argument("--port", type=int, default=5000, help="port of the server")
+    parser.add_argument("--bots", type=int, help="connect this many headless bots instead of playing")
+    parser.add_argument("--seconds", type=float, default=10, help="how long the bots play")
+    args = parser.parse_args()
+
+    if args.bots:
+        asyncio.run(run_bots(args.host, args.port, args.bots, args.seconds))
+    else:
+        asyncio.run(play(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+Command line tool that converts maps from the JSON format to the binary format
+(see maps.load_binary), which opens much faster for big maps. The binary file is
+written next to the JSON file and is used instead of it by maps.load_map.
+
+Example:
+    python3 convertmap.py maps/map0.json maps/map1.json
+"""
+import argparse
+import os
+import maps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert JSON maps to the binary map format.")
+    parser.add_argument("files", nargs="+", help="the JSON map files to convert")
+    parser.add_argument("--output", help="the file to write (only with a single map), default is the JSON file with .ctfmap")
+    args = parser.parse_args()
+    if args.output and len(args.files) > 1:
+        parser.error("--output can only be used with a single map")
+
+    for file in args.files:
+        name = os.path.splitext(os.path.basename(file))[0]
+        output = args.output or os.path.splitext(file)[0] + '.ctfmap'
+        maps.save_binary(maps.load_json(name, file), output)
+        print(f"{file} -> {output} ({os.path.getsize(file)} -> {os.path.getsize(output)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,17 +6,14 @@ import maps
 import gameobjects
 import images
 
-pygame.init()
-
 SCREEN_WIDTH, SCREEN_HEIGHT = 800, 600
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("Capture The Flag")
+screen = None  # The window, opened by open_window so that importing this module opens nothing
 
 
-# Fonts and Colors
-TITLE_FONT = pygame.font.SysFont("Times New Roman", 74)
-BUTTON_FONT = pygame.font.SysFont("Times New Roman", 50)
-selected_font3 = pygame.font.SysFont("Times New Roman", 30)
+# Fonts and Colors, the fonts are loaded by open_window
+TITLE_FONT = None
+BUTTON_FONT = None
+selected_font3 = None
 WHITE = (255, 255, 255)
 BLUE = (0, 102, 204)
 LIGHT_BLUE = (173, 216, 230)
@@ -24,6 +21,19 @@ scores = [0, 0, 0, 0, 0, 0]
 coop_scores = [0, 0, 0]
 
 
+def open_window():
+    """
+    Starts pygame (display, mixer and fonts) and opens the window of the menu
+    """
+    global screen, TITLE_FONT, BUTTON_FONT, selected_font3
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("Capture The Flag")
+    TITLE_FONT = pygame.font.SysFont("Times New Roman", 74)
+    BUTTON_FONT = pygame.font.SysFont("Times New Roman", 50)
+    selected_font3 = pygame.font.SysFont("Times New Roman", 30)
+
+
 def draw_text(text, font, color, surface, x, y):
     """
     Draws text with given attributes
@@ -33,10 +43,11 @@ def draw_text(text, font, color, surface, x, y):
     surface.blit(text_obj, text_rect)
 
 
-def button(text, back_collor, text_collor, y, x=None, font=BUTTON_FONT, width=250, height=50):
+def button(text, back_collor, text_collor, y, x=None, font=None, width=250, height=50):
     """
-    Creates a button with given attributes
+    Creates a button with given attributes, in BUTTON_FONT if no font is given
     """
+    font = font or BUTTON_FONT
     x = SCREEN_WIDTH // 2 - width // 2 if not x else x
     button = pygame.Rect(x, y, width, height)
     pygame.draw.rect(screen, back_collor, button)
@@ -69,13 +80,8 @@ def main_menu():
     """
     global screen  # Use global screen reference
 
-    # Initialize display only if needed
-    if not pygame.get_init():
-        pygame.init()
-
     # Set up display
-    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-    pygame.display.set_caption("Capture The Flag")
+    open_window()
 
     while True:
         screen.fill(BLUE)
@@ -175,28 +181,36 @@ def show_settings_AI():
         pygame.display.flip()
 
 
+#  The names shown for the maps that come with the game, other maps are shown with their file name
+MAP_NAMES = {"map2": "Small", "map0": "Medium", "map1": "Large", "custom_map": "Custom map"}
+#  Where the maps of a page of the map selection are shown (x, y), the preview fits in 144x144
+MAP_SLOTS = [(80, 130), (450, 130), (80, 330), (450, 330)]
+
+
 def show_settings_Map():
     """
-    Creates map settings window
+    Creates map settings window, the maps are shown a page at a time and only the maps
+    of the current page are loaded
     """
+    available = maps.available_maps()
+    names = [name for name in MAP_NAMES if name in available] + [name for name in available if name not in MAP_NAMES]
+    page = 0
     while True:
         screen.fill(WHITE)
 
         draw_text("MAP SELECTION", TITLE_FONT, BLUE, screen, SCREEN_WIDTH // 2, SCREEN_HEIGHT // 4 - 100)
 
-        display_map(maps.map2, 80, 150, 144 / 9 * 10, 145 / 9 * 5)
-        small_button = button("Small", WHITE, BLUE, SCREEN_HEIGHT // 2 - 50, 40)
-
-        display_map(maps.map0, 330, 150, 144, 144)
-        medium_button = button("Medium", WHITE, BLUE, SCREEN_HEIGHT // 2, 280)
-
-        display_map(maps.map1, 530, 150, 144 / 9 * 15, 144 / 9 * 11)
-        large_button = button("Large", WHITE, BLUE, SCREEN_HEIGHT // 2 + 30, 510)
+        map_buttons = []
+        for name, (x, y) in zip(names[page * len(MAP_SLOTS):], MAP_SLOTS):
+            current_map = maps.load_map(name)
+            tile = 144 // max(current_map.width, current_map.height)
+            display_map(current_map, x, y, tile * current_map.width, tile * current_map.height)
+            map_buttons.append((button(MAP_NAMES.get(name, name), WHITE, BLUE, y + 150, x, selected_font3, 250, 40), name))
 
-        display_map(maps.custom_map, 80, 340, 144, 144)
-        custommap_button = button("Custom map", WHITE, BLUE, SCREEN_HEIGHT // 2 + 190, 40)
-
-        back_button = button("Back", WHITE, BLUE, SCREEN_HEIGHT // 2 + 190, 500)
+        back_button = button("Back", WHITE, BLUE, SCREEN_HEIGHT - 70, 500)
+        next_button = None
+        if len(names) > len(MAP_SLOTS):
+            next_button = button("More maps", WHITE, BLUE, SCREEN_HEIGHT - 70, 80)
 
         # Event Handling
         for event in pygame.event.get():
@@ -206,21 +220,13 @@ def show_settings_Map():
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:  # Left mouse click
                 if back_button.collidepoint(event.pos):
                     return
-                elif medium_button.collidepoint(event.pos):
-                    rungame.current_map = maps.map0
-                    print("Map0")
-                    return
-                elif large_button.collidepoint(event.pos):
-                    rungame.current_map = maps.map1
-                    print("Map1")
-                    return
-                elif small_button.collidepoint(event.pos):
-                    rungame.current_map = maps.map2
-                    print("MAP2")
-                    return
-                elif custommap_button.collidepoint(event.pos):
-                    rungame.current_map = maps.custom_map
-                    print("Custom Map")
+                elif next_button and next_button.collidepoint(event.pos):
+                    page = (page + 1) % ((len(names) + len(MAP_SLOTS) - 1) // len(MAP_SLOTS))
+                for map_button, name in map_buttons:
+                    if map_button.collidepoint(event.pos):
+                        rungame.current_map = maps.load_map(name)
+                        print(name)
+                        return
         pygame.display.flip()
 
 
@@ -2,9 +2,12 @@
 This module contains support for the different game objects: tank, boxes...
 """
 import math
+import time
+from collections import OrderedDict
 import pygame
 import pymunk
 import images
+import profiling
 import sounds
 
 
@@ -15,9 +18,20 @@ BULLET_COLLISION_TYPE = 2
 TANK_COLLISION_TYPE = 3
 BORDER_COLLISION_TYPE = 4
 
+BULLET_CATEGORY = 0b1  # Collision category of the bullets, so queries can leave them out
+TANK_CATEGORY = 0b10  # Collision category of the tanks, so queries can look for them only
+
 total_rounds_fired = 0
 hard_ai = False
 
+POOL_SIZE = 256  # Number of unused bullets or explosions a pool keeps at most
+
+ROTATION_STEP = 1  # Sprites are rotated by a multiple of this many degrees
+ROTATION_CACHE_SIZE = 1024  # Number of rotated sprites kept before the least recently used is dropped
+
+rotation_cache = OrderedDict()
+profiler = profiling.NULL_PROFILER  # Measures the time spent rotating sprites, see profiling.py
+
 
 def physics_to_display(x):
     """
@@ -26,6 +40,64 @@ def physics_to_display(x):
     return x * images.TILE_SIZE
 
 
+def rotate_sprite(sprite, angle):
+    """
+    Returns the sprite rotated by angle degrees, rounded to ROTATION_STEP. Rotated
+    sprites are cached, so an object that does not turn is only rotated once.
+    """
+    angle = round(angle / ROTATION_STEP) * ROTATION_STEP % 360
+    key = (sprite, angle, sprite.get_alpha())
+    rotated = rotation_cache.get(key)
+    if rotated is None:
+        start = time.perf_counter()
+        rotated = pygame.transform.rotate(sprite, angle)
+        profiler.add("rotation", time.perf_counter() - start)
+        rotation_cache[key] = rotated
+        if len(rotation_cache) > ROTATION_CACHE_SIZE:
+            rotation_cache.popitem(last=False)
+    else:
+        rotation_cache.move_to_end(key)
+    return rotated
+
+
+class Pool:
+    """
+    Keeps objects that are no longer used (bullets, explosions) so that they can
+    be reset and used again instead of creating new ones. The objects need a
+    reset method that takes the same arguments as their constructor.
+    """
+
+    def __init__(self, create, max_size=POOL_SIZE):
+        """
+        Takes as argument the function (usually the class) that creates a new object
+        and how many unused objects are kept at most.
+        """
+        self.create = create
+        self.max_size = max_size
+        self.free = []
+        self.hits = 0  # Number of objects that were reused
+        self.misses = 0  # Number of objects that had to be created
+
+    def acquire(self, *args):
+        """
+        Returns an unused object reset with args, or a new one if there is none.
+        """
+        if self.free:
+            self.hits += 1
+            obj = self.free.pop()
+            obj.reset(*args)
+            return obj
+        self.misses += 1
+        return self.create(*args)
+
+    def release(self, obj):
+        """
+        Gives back an object that is no longer used.
+        """
+        if len(self.free) < self.max_size:
+            self.free.append(obj)
+
+
 class GameObject:
     """
     Mostly handles visual aspects (pygame) of an object.
@@ -39,6 +111,7 @@ class GameObject:
 
         """
         self.sprite = sprite
+        self.previous_pose = None  # Screen position and orientation before the last physics step
 
     def update(self):
         """
@@ -54,16 +127,37 @@ class GameObject:
         """
         return
 
-    def update_screen(self, screen):
+    def save_pose(self):
         """
-        Updates the visual part of the game. Should NOT need to be changed
-        by a subclass.
+        Remembers where the object is on the screen, called before a physics step
+        so the display can interpolate between the last two steps.
         """
+        self.previous_pose = (self.screen_position(), self.screen_orientation())
 
-        sprite = self.sprite
+    def screen_pose(self, interpolation=1.0):
+        """
+        Returns the position and orientation on the screen, blended between the pose
+        saved before the last physics step (interpolation 0) and the current one (1).
+        """
+        position = self.screen_position()
+        orientation = self.screen_orientation()
+        if self.previous_pose is None or interpolation >= 1:
+            return position, orientation
+        previous_position, previous_orientation = self.previous_pose
+        if previous_position.get_distance(position) > images.TILE_SIZE:
+            return position, orientation  # The object was teleported, for instance a tank that respawned
+        turn = (orientation - previous_orientation + 180) % 360 - 180
+        return (previous_position + (position - previous_position) * interpolation,
+                previous_orientation + turn * interpolation)
 
-        p = self.screen_position()  # Get the position of the object (pygame coordinates)
-        sprite = pygame.transform.rotate(sprite, self.screen_orientation())  # Rotate the sprite using the rotation of the object
+    def screen_sprite(self, interpolation=1.0):
+        """
+        Returns the sprite rotated like the object and the rectangle of the screen
+        it covers. Should NOT need to be changed by a subclass.
+        """
+
+        p, orientation = self.screen_pose(interpolation)  # Get the position of the object (pygame coordinates)
+        sprite = rotate_sprite(self.sprite, orientation)  # Rotate the sprite using the rotation of the object
 
         # The position of the screen correspond to the center of the object,
         # but the function screen.blit expect to receive the top left corner
@@ -72,7 +166,15 @@ class GameObject:
         # corner of the sprite
         offset = pymunk.Vec2d(*sprite.get_size()) / 2.
         p = p - offset
-        screen.blit(sprite, p)  # Copy the sprite on the screen
+        return sprite, sprite.get_rect(topleft=(int(p.x), int(p.y)))
+
+    def update_screen(self, screen):
+        """
+        Updates the visual part of the game. Should NOT need to be changed
+        by a subclass.
+        """
+        sprite, rect = self.screen_sprite()
+        screen.blit(sprite, rect)  # Copy the sprite on the screen
 
 
 class GamePhysicsObject(GameObject):
@@ -195,6 +297,7 @@ class Tank(GamePhysicsObject):
 
         self.shoot_last = 0
         self.shape.collision_type = TANK_COLLISION_TYPE
+        self.shape.filter = pymunk.ShapeFilter(categories=TANK_CATEGORY)
         self.shape.parent = self
 
         self.hp = Tank.HP
@@ -213,6 +316,9 @@ class Tank(GamePhysicsObject):
         self.ai = None
         self.ai_controll = False
 
+        self.bullet_pool = None  # Pool the bullets are taken from, if the game has one
+        self.bullet_engine = None  # Kinematic engine that moves the bullets, if the game uses one
+
         self.team = None
 
     def accelerate(self):
@@ -310,13 +416,18 @@ class Tank(GamePhysicsObject):
 
     def make_ai(self, ai, ai_controll):
         """
-        Makes a tank AI
+        Makes a tank AI, or gives it back to a player (the tank gets its normal speeds)
         """
         if ai_controll and hard_ai:
             self.max_speed = Tank.AI_SPEED
             self.bullet_speed = Tank.AI_BULLET_SPEED
             self.base_acceleration = Tank.AI_ACCELERATION
             self.ai_controll = True
+        elif self.ai_controll:
+            self.max_speed = Tank.NORMAL_MAX_SPEED
+            self.bullet_speed = Tank.BULLET_SPEED
+            self.base_acceleration = Tank.ACCELERATION
+            self.ai_controll = False
         self.ai = ai
 
     def has_won(self):
@@ -332,7 +443,13 @@ class Tank(GamePhysicsObject):
         if self.shoot_last >= (FRAMERATE // (self.FIRERATE * 3)) or (self.ai_controll and self.shoot_last >= (FRAMERATE // (self.AI_FIRERATE * 3)) and hard_ai):
             sounds.play_sound(sounds.bullet_sound)
             self.shoot_last = 0
-            bullets_list.append(Bullet(self, space))
+            self.rounds_fired += 1
+            if self.bullet_engine is not None:
+                bullets_list.append(self.bullet_engine.fire(self))
+            elif self.bullet_pool is not None:
+                bullets_list.append(self.bullet_pool.acquire(self, space))
+            else:
+                bullets_list.append(Bullet(self, space))
             self.body.velocity = pymunk.Vec2d(
                 1 * math.cos(self.body.angle - math.pi / 2),
                 1 * math.sin(self.body.angle - math.pi / 2)
@@ -360,13 +477,39 @@ class Bullet(GamePhysicsObject):
         """
         Create a bullet object with the given parameters
         """
-        x = tank.body.position.x + (0.5 * math.cos(math.radians(tank.screen_orientation() - 90)))
-        y = tank.body.position.y + (0.5 * math.sin(math.radians(tank.screen_orientation() + 90)))
+        x, y = Bullet.start_position(tank)
         super().__init__(x, y, math.degrees(tank.body.angle) + 90, images.bullet, space, True)
         self.bullet_speed = tank.bullet_speed
+        self.owner = tank
         self.shape.collision_type = BULLET_COLLISION_TYPE
+        self.shape.filter = pymunk.ShapeFilter(categories=BULLET_CATEGORY)
         self.shape.parent = self
 
+    @staticmethod
+    def start_position(tank):
+        """
+        Returns where a bullet shot by the tank starts, just in front of it.
+        """
+        x = tank.body.position.x + (0.5 * math.cos(math.radians(tank.screen_orientation() - 90)))
+        y = tank.body.position.y + (0.5 * math.sin(math.radians(tank.screen_orientation() + 90)))
+        return x, y
+
+    def reset(self, tank, space):
+        """
+        Makes a bullet taken from a pool look like a new bullet shot by the tank,
+        and adds it back to the space.
+        """
+        self.body.position = Bullet.start_position(tank)
+        self.body.angle = tank.body.angle + math.pi / 2
+        self.body.velocity = 0, 0
+        self.body.angular_velocity = 0
+        self.body.force = 0, 0
+        self.body.torque = 0
+        self.bullet_speed = tank.bullet_speed
+        self.owner = tank
+        self.previous_pose = None
+        space.add(self.body, self.shape)
+
     def update(self):
         """
         Call this function to make the bullet move forward.
@@ -390,6 +533,28 @@ class Box(GamePhysicsObject):
         self.shape.parent = self
 
 
+class RockWall:
+    """
+    The collision shapes of the rock boxes of a map, one static rectangle for each
+    group of rock tiles merged by Map.rock_rectangles. The rocks are drawn one tile
+    at a time by sprites without physics.
+    """
+
+    def __init__(self, rectangles, space):
+        """
+        Takes as argument the rectangles (x, y, width, height) in tiles and the space to add them to.
+        """
+        self.destructable = False
+        self.body = space.static_body
+        self.shapes = []
+        for x, y, width, height in rectangles:
+            shape = pymunk.Poly(self.body, [(x, y), (x, y + height), (x + width, y + height), (x + width, y)])
+            shape.collision_type = BOX_COLLISION_TYPE
+            shape.parent = self
+            self.shapes.append(shape)
+        space.add(*self.shapes)
+
+
 def get_box_with_type(x, y, type, space):
     """
     Create a box with the correct type at coordinate x, y.
@@ -453,6 +618,14 @@ class Explosion(GameVisibleObject):
         self.time_pased = 0
         self.sprite.set_alpha(128)
 
+    def reset(self, x, y):
+        """
+        Makes an explosion taken from a pool start again at (x, y).
+        """
+        self.x = x
+        self.y = y
+        self.time_pased = 0
+
     def update(self):
         self.time_pased += 1
         if self.time_pased >= 5:
@@ -1,4 +1,7 @@
 """ Graphics assests for the game
+
+The images are loaded the first time they are used (images.grass loads
+grass.png), so importing this module is instant and does not need a display.
 """
 
 import pygame
@@ -14,31 +17,44 @@ def load_image(file):
         surface = pygame.image.load(file)
     except pygame.error:
         raise SystemExit('Could not load image "%s" %s' % (file, pygame.get_error()))
+    if pygame.display.get_surface() is None:
+        #  Without a display (for instance in a simulation worker) the image can not
+        #  be converted to the pixel format of the screen, and does not need to be
+        return surface
     return surface.convert_alpha()
 
 
-TILE_SIZE = 40  # Define the default size of tiles
-
-explosion = load_image('explosion.png')  # Image of an explosion
-
-grass = load_image('grass.png')  # Image of a grass tile
-
-rockbox = load_image('rockbox.png')  # Image of a rock box (wall)
+def load_bullet():
+    """ Load the image of a bullet, scaled down. """
+    bullet = load_image('bullet.png')
+    bullet = pygame.transform.scale(bullet, (10, 10))
+    return pygame.transform.rotate(bullet, 0)
 
-metalbox = load_image('metalbox.png')  # Image of a metal box
 
-woodbox = load_image('woodbox.png')  # Image of a wood box
-
-flag = load_image('flag.png')  # Image of flag
-
-bullet = load_image('bullet.png')
-bullet = pygame.transform.scale(bullet, (10, 10))
-bullet = pygame.transform.rotate(bullet, 0)
-
-# List of image of tanks of different colors
-tanks = [load_image('tank_orange.png'), load_image('tank_blue.png'), load_image('tank_white.png'),
-         load_image('tank_yellow.png'), load_image('tank_red.png'), load_image('tank_gray.png')]
+TILE_SIZE = 40  # Define the default size of tiles
 
-# List of image of bases corresponding to the color of each tank
-bases = [load_image('base_orange.png'), load_image('base_blue.png'), load_image('base_white.png'),
-         load_image('base_yellow.png'), load_image('base_red.png'), load_image('base_gray.png')]
+#  How to load each image, the first time it is used
+ASSETS = {
+    'explosion': lambda: load_image('explosion.png'),  # Image of an explosion
+    'grass': lambda: load_image('grass.png'),  # Image of a grass tile
+    'rockbox': lambda: load_image('rockbox.png'),  # Image of a rock box (wall)
+    'metalbox': lambda: load_image('metalbox.png'),  # Image of a metal box
+    'woodbox': lambda: load_image('woodbox.png'),  # Image of a wood box
+    'flag': lambda: load_image('flag.png'),  # Image of flag
+    'bullet': load_bullet,
+    # List of image of tanks of different colors
+    'tanks': lambda: [load_image('tank_orange.png'), load_image('tank_blue.png'), load_image('tank_white.png'),
+                      load_image('tank_yellow.png'), load_image('tank_red.png'), load_image('tank_gray.png')],
+    # List of image of bases corresponding to the color of each tank
+    'bases': lambda: [load_image('base_orange.png'), load_image('base_blue.png'), load_image('base_white.png'),
+                      load_image('base_yellow.png'), load_image('base_red.png'), load_image('base_gray.png')],
+}
+
+
+def __getattr__(name):
+    """ Loads an image of ASSETS the first time it is used, it is then kept in the module. """
+    if name not in ASSETS:
+        raise AttributeError("module 'images' has no attribute '%s'" % name)
+    value = ASSETS[name]()
+    globals()[name] = value
+    return value
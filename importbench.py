@@ -0,0 +1,72 @@
+"""
+Command line benchmark of how long it takes to start the game framework. Every
+measure runs in a fresh python process, so nothing is already imported or loaded.
+
+Example:
+    python3 importbench.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+#  What is measured, each one is run in a new process
+BENCHMARKS = {
+    "pygame": "import pygame",
+    "images": "import images",
+    "sounds": "import sounds",
+    "simulation": "import simulation",
+    "rungame": "import rungame",
+    "worker": "import simulation, maps; simulation.GameSession(maps.load_map('map0')).step(1)",
+}
+
+#  Runs the benchmark and prints the time it took and whether SDL video and audio were started
+PROBE = """
+import time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+import pygame
+print(elapsed, bool(pygame.display.get_init()), bool(pygame.mixer.get_init()))
+"""
+
+
+def measure(code):
+    """
+    Runs code in a new python process and returns how long it took (in seconds)
+    and whether the display and the mixer were initialised.
+    """
+    output = subprocess.run([sys.executable, "-c", PROBE.format(code=code)], capture_output=True, text=True, check=True,
+                            env=dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1"))
+    elapsed, display, mixer = output.stdout.split()[-3:]
+    return float(elapsed), display == "True", mixer == "True"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the start up time of the game framework.")
+    parser.add_argument("--runs", type=int, default=5, help="number of processes started for each measure")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    for name, code in BENCHMARKS.items():
+        runs = [measure(code) for run in range(args.runs)]
+        times = [elapsed for elapsed, display, mixer in runs]
+        results[name] = {
+            "median": statistics.median(times),
+            "min": min(times),
+            "display": any(display for elapsed, display, mixer in runs),
+            "mixer": any(mixer for elapsed, display, mixer in runs),
+        }
+        entry = results[name]
+        print(f"{name:<12} median {entry['median'] * 1000:7.1f} ms, min {entry['min'] * 1000:7.1f} ms,"
+              f" display {'yes' if entry['display'] else 'no'}, audio {'yes' if entry['mixer'] else 'no'}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Line of sight for the AIs. Every AI tank looks straight ahead for something to
+shoot at. The rays of all the tanks are answered together once per tick, and a
+ray is only cast again when the tank, or something that could be in its way
+(a tank, a box or a bullet), has moved.
+"""
+import math
+
+import pymunk
+import gameobjects
+
+SIGHT_RANGE = 100  # Length of the ray cast in front of a tank
+SIGHT_START = 0.3  # The ray starts this far in front of the tank, outside of its own shape
+OBJECT_RADIUS = 0.75  # Radius of a circle that holds a tank, a box or a bullet
+
+#  What a ray can hit
+NOTHING = 0
+TANK = 1
+BOX = 2
+WALL = 3
+BULLET = 4
+
+
+def ray(tank):
+    """
+    Returns the start and the end of the ray cast in front of a tank.
+    """
+    heading = pymunk.Vec2d(math.cos(tank.body.angle + math.pi / 2), math.sin(tank.body.angle + math.pi / 2))
+    return tank.body.position + heading * SIGHT_START, tank.body.position + heading * SIGHT_RANGE
+
+
+class Sighting:
+    """
+    The first thing in front of a tank.
+    """
+
+    def __init__(self, kind, obj, point, start):
+        """
+        Takes as argument what was hit (kind), the game object (obj, None for a wall
+        or nothing), the point where it was hit and the start of the ray.
+        """
+        self.kind = kind
+        self.obj = obj
+        self.point = point
+        self.start = start
+        self.destructable = kind == BOX and obj.destructable
+        self.team = obj.team if kind == TANK else None
+
+
+def distance_to_segment(point, start, end):
+    """
+    Returns the distance between a point and the segment from start to end.
+    """
+    segment = end - start
+    length_squared = segment.get_length_sqrd()
+    if length_squared == 0:
+        return point.get_distance(start)
+    t = min(max((point - start).dot(segment) / length_squared, 0), 1)
+    return point.get_distance(start + segment * t)
+
+
+class LineOfSight:
+    """
+    Casts and caches the rays of the AI tanks of one game.
+    """
+
+    def __init__(self, space, tanks_list, grid=None, bullets_list=None):
+        """
+        Takes as argument the physics space, the tanks, the occupancy grid
+        (used to know which boxes can move and when a box was destroyed) and the bullets.
+        """
+        self.space = space
+        self.tanks_list = tanks_list
+        self.grid = grid
+        self.bullets_list = bullets_list if bullets_list is not None else []
+        self.cache = {}  # (pose, grid version, tick, sighting) per tank
+        self.poses = {}  # (position, angle) of every movable object at the start of the tick
+        self.moved = []  # (object, old position, new position) of the objects that moved since the last tick
+        self.tick = 0
+        self.queries = 0  # Number of rays cast, for profiling
+        self.reused = 0  # Number of rays answered from the cache, for profiling
+
+    def movable(self):
+        """
+        Returns the tanks, boxes and bullets that a ray can hit and that can move.
+        """
+        movable = list(self.tanks_list)
+        if self.grid is not None:
+            movable += list(self.grid.box_tiles)
+        #  The bullets of a bullet engine are in a space of their own, the rays do not see them
+        movable += [bullet for bullet in self.bullets_list if bullet.body.space is self.space]
+        return movable
+
+    def begin_tick(self):
+        """
+        Finds the tanks, boxes and bullets that moved or turned since the last tick,
+        once for all the AIs. Even the smallest move counts, it could be the one that
+        puts a corner in the way of a ray.
+        """
+        self.tick += 1
+        poses = {}
+        self.moved = []
+        for obj in self.movable():
+            pose = (obj.body.position, obj.body.angle)
+            previous = self.poses.get(obj)
+            if previous != pose:
+                self.moved.append((obj, previous[0] if previous is not None else pose[0], pose[0]))
+            poses[obj] = pose
+        self.poses = poses
+
+    def sight(self, tank):
+        """
+        Returns the Sighting in front of the tank. A sighting is only reused if it was
+        taken or checked in the last tick, as the moves of one tick are all that is kept.
+        """
+        pose = (tank.body.position, tank.body.angle)
+        version = getattr(self.grid, "version", 0)
+        cached = self.cache.get(tank)
+        if cached is not None:
+            cached_pose, cached_version, tick, sighting = cached
+            #  A bullet that was seen has moved on or is gone by now
+            unchanged = sighting.kind != BULLET and cached_pose == pose and cached_version == version
+            if unchanged and tick >= self.tick - 1 and not self.blocked(sighting, tank):
+                self.reused += 1
+                self.cache[tank] = (pose, version, self.tick, sighting)
+                return sighting
+        sighting = self.cast(tank)
+        self.cache[tank] = (pose, version, self.tick, sighting)
+        return sighting
+
+    def blocked(self, sighting, tank):
+        """
+        Checks if something that moved since the last tick could have entered or
+        left the part of the ray that was looked at.
+        """
+        for obj, old_position, new_position in self.moved + self.shot_since_begin():
+            if obj is tank:
+                continue
+            if distance_to_segment(old_position, sighting.start, sighting.point) < OBJECT_RADIUS:
+                return True
+            if distance_to_segment(new_position, sighting.start, sighting.point) < OBJECT_RADIUS:
+                return True
+        return False
+
+    def shot_since_begin(self):
+        """
+        Returns (bullet, old position, new position) for the bullets shot by the AIs
+        that already had their turn in this tick, which begin_tick could not see.
+        """
+        shot = []
+        for bullet in self.bullets_list:
+            position = bullet.body.position
+            previous = self.poses.get(bullet)
+            if bullet.body.space is self.space and (previous is None or previous[0] != position):
+                shot.append((bullet, previous[0] if previous is not None else position, position))
+        return shot
+
+    def cast(self, tank):
+        """
+        Makes a raycast query in front of the tank and returns what it hit.
+        """
+        self.queries += 1
+        start, end = ray(tank)
+        hit = self.space.segment_query_first(start, end, 0, pymunk.ShapeFilter())
+        if hit is None:
+            return Sighting(NOTHING, None, end, start)
+        collision_type = hit.shape.collision_type
+        if collision_type == gameobjects.TANK_COLLISION_TYPE:
+            return Sighting(TANK, hit.shape.parent, hit.point, start)
+        if collision_type == gameobjects.BOX_COLLISION_TYPE:
+            return Sighting(BOX, hit.shape.parent, hit.point, start)
+        if collision_type == gameobjects.BULLET_COLLISION_TYPE:
+            return Sighting(BULLET, hit.shape.parent, hit.point, start)
+        return Sighting(WALL, None, hit.point, start)
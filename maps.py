@@ -1,6 +1,16 @@
 import images
 import pygame
 import json
+import mmap
+import os
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None  # Only makes checking the tiles of a binary map faster
+
+main_dir = os.path.split(os.path.abspath(__file__))[0]
 
 
 class Map:
@@ -12,12 +22,27 @@ class Map:
         """
         Takes as argument the size of the map (width, height), an array with the boxes type,
         the start position of tanks (start_positions) and the position of the flag (flag_position).
+        boxes is either a list of rows or the tiles of every row one after the other, one byte
+        per tile (for instance a memoryview of a mapped file, which is then not copied).
         """
         self.width = width
         self.height = height
-        self.boxes = boxes
+        if isinstance(boxes, (bytes, bytearray, memoryview)):
+            self.tiles = boxes
+        else:
+            self.tiles = b''.join(bytes(row) for row in boxes)
         self.start_positions = start_positions
         self.flag_position = flag_position
+        self.rocks = None  # The rock tiles merged into rectangles, see rock_rectangles
+        self.name = None  # The name of the file of the map, set by load_map
+
+    @property
+    def boxes(self):
+        """
+        The rows of the map, each row is a view of the tiles (not a copy).
+        """
+        tiles = memoryview(self.tiles)
+        return [tiles[y * self.width:(y + 1) * self.width] for y in range(self.height)]
 
     def rect(self):
         """
@@ -29,27 +54,296 @@ class Map:
         """
         Return the type of the box at coordinates (x, y).
         """
-        return self.boxes[y][x]
+        return self.tiles[x + y * self.width]
+
+    def rock_rectangles(self):
+        """
+        Returns the rock tiles merged into rectangles (x, y, width, height) that cover
+        them all, so a wall needs a few collision shapes instead of one per tile. Each
+        rectangle is grown as far right as possible, then down while the whole span is
+        rock. Computed once per map.
+        """
+        if self.rocks is not None:
+            return self.rocks
+        width = self.width
+        tiles = memoryview(self.tiles)
+        covered = bytearray(width * self.height)
+        self.rocks = []
+        for y in range(self.height):
+            x = 0
+            while x < width:
+                index = x + y * width
+                if tiles[index] != 1 or covered[index]:
+                    x += 1
+                    continue
+                end = x + 1
+                while end < width and tiles[index + end - x] == 1 and not covered[index + end - x]:
+                    end += 1
+                span = end - x
+                bottom = y + 1
+                while bottom < self.height:
+                    start = x + bottom * width
+                    if tiles[start:start + span] != b'\x01' * span or any(covered[start:start + span]):
+                        break
+                    bottom += 1
+                for row in range(y, bottom):
+                    covered[x + row * width:end + row * width] = b'\x01' * span
+                self.rocks.append((x, y, span, bottom - y))
+                x = end
+        return self.rocks
+
+
+class OccupancyGrid:
+    """
+    The live state of the tiles of a map during a game. Unlike Map.boxes it follows
+    boxes that are destroyed or pushed to another tile. Every change increases
+    version, so anything computed from the grid knows when it is out of date. The
+    changes are kept until nothing computed from an older version needs them (see trim).
+    """
+
+    def __init__(self, current_map):
+        """
+        Takes as argument the map to copy the initial layout from.
+        """
+        self.width = current_map.width
+        self.height = current_map.height
+        self.cells = bytearray(current_map.tiles)
+        self.version = 0
+        self.changes = []  # (x, y, old type, new type) of every change since version trimmed
+        self.trimmed = 0  # Version of the first change kept
+        self.box_tiles = {}  # The tile of every tracked movable box
+        self.tile_boxes = {}  # The movable box on every tracked tile
+
+    def boxAt(self, x, y):
+        """
+        Return the type of the box at coordinates (x, y).
+        """
+        return self.cells[int(x) + int(y) * self.width]
 
+    def set_box(self, x, y, box_type):
+        """
+        Changes the type of the tile at (x, y) and increases the version.
+        """
+        index = x + y * self.width
+        if self.cells[index] != box_type:
+            self.changes.append((x, y, self.cells[index], box_type))
+            self.cells[index] = box_type
+            self.version += 1
 
-with open('maps/map0.json', 'r', encoding='utf-8') as file:
-    map0_data = json.load(file)
+    def changes_since(self, version):
+        """
+        Returns the changes made after version, or None if some of them were trimmed.
+        """
+        if version < self.trimmed:
+            return None
+        return self.changes[version - self.trimmed:]
 
-map0 = Map(map0_data["width"], map0_data["height"], map0_data["boxes"], map0_data["tanks"], map0_data["flag"])
+    def trim(self, version):
+        """
+        Forgets the changes made before version, nothing needs them anymore.
+        """
+        if version > self.trimmed:
+            del self.changes[:version - self.trimmed]
+            self.trimmed = version
 
-with open('maps/map1.json', 'r', encoding='utf-8') as file:
-    map1_data = json.load(file)
+    def track(self, box, box_type):
+        """
+        Follows a movable box so the grid is updated when it is pushed.
+        """
+        box.box_type = box_type
+        tile = self.tile_of(box)
+        self.box_tiles[box] = tile
+        self.tile_boxes[tile] = box
 
-map1 = Map(map1_data["width"], map1_data["height"], map1_data["boxes"], map1_data["tanks"], map1_data["flag"])
+    def tile_of(self, box):
+        """
+        Returns the tile the centre of the box is on, clamped to the map.
+        """
+        x, y = box.body.position
+        return (min(max(int(x), 0), self.width - 1), min(max(int(y), 0), self.height - 1))
 
+    def remove(self, box):
+        """
+        Clears the tile of a box that was destroyed.
+        """
+        tile = self.box_tiles.pop(box, None)
+        if tile is None:
+            tile = self.tile_of(box)
+        if self.tile_boxes.get(tile, box) is box:
+            self.tile_boxes.pop(tile, None)
+            self.set_box(tile[0], tile[1], 0)
 
-with open('maps/map2.json', 'r', encoding='utf-8') as file:
-    map2_data = json.load(file)
+    def update_boxes(self):
+        """
+        Moves the tracked boxes that crossed a tile boundary since the last call.
+        """
+        for box, old_tile in list(self.box_tiles.items()):
+            tile = self.tile_of(box)
+            if tile != old_tile:
+                if self.tile_boxes.get(old_tile) is box:
+                    del self.tile_boxes[old_tile]
+                    self.set_box(old_tile[0], old_tile[1], 0)
+                self.box_tiles[box] = tile
+                self.tile_boxes[tile] = box
+                self.set_box(tile[0], tile[1], box.box_type)
 
-map2 = Map(map2_data["width"], map2_data["height"], map2_data["boxes"], map2_data["tanks"], map2_data["flag"])
 
+#  The type of box of each tile is one of these (0 is grass)
+BOX_TYPES = (0, 1, 2, 3)
 
-with open('maps/custom_map.json', 'r', encoding='utf-8') as file:
-    custom_map_data = json.load(file)
+#  The files a map can be read from, the binary file is used when a map has both
+EXTENSIONS = ('.ctfmap', '.json')
 
-custom_map = Map(custom_map_data["width"], custom_map_data["height"], custom_map_data["boxes"], custom_map_data["tanks"], custom_map_data["flag"])
+#  The binary format: a header (magic, version, number of tanks, width, height), the start
+#  position of each tank (x, y, angle), the flag (x, y) and then one byte per tile, row by row
+MAGIC = b'CTFM'
+VERSION = 1
+HEADER = struct.Struct('<4sHHII')
+TANK = struct.Struct('<3d')
+FLAG = struct.Struct('<2d')
+CHECK_CHUNK = 64 * 1024  # Tiles of a binary map checked at once without NumPy
+
+#  Maps already parsed, name -> (file, modification time of the file, Map)
+cache = {}
+
+
+def map_file(name):
+    """
+    Returns the path of the file of the map called name, or None if there is no such map.
+    """
+    for extension in EXTENSIONS:
+        file = os.path.join(main_dir, 'maps', name + extension)
+        if os.path.isfile(file):
+            return file
+    return None
+
+
+def available_maps():
+    """
+    Returns the sorted names of the maps in the maps directory, without loading them.
+    """
+    return sorted({os.path.splitext(entry.name)[0] for entry in os.scandir(os.path.join(main_dir, 'maps'))
+                   if os.path.splitext(entry.name)[1] in EXTENSIONS and entry.is_file()})
+
+
+def validate_positions(name, width, height, tanks, flag):
+    """
+    Checks that the start positions of the tanks and the flag are on the map, raises ValueError if not.
+    """
+    if not isinstance(tanks, list) or not tanks:
+        raise ValueError("map %s: at least one tank start position is needed" % name)
+    for position in tanks + [flag]:
+        if not isinstance(position, (list, tuple)) or len(position) != (2 if position is flag else 3) \
+                or not (0 <= position[0] <= width and 0 <= position[1] <= height):
+            raise ValueError("map %s: position %s is not on the map" % (name, position))
+
+
+def validate(name, map_data):
+    """
+    Checks that the content of a map file describes a valid map, raises ValueError if not.
+    """
+    width = map_data.get("width")
+    height = map_data.get("height")
+    if not isinstance(width, int) or not isinstance(height, int) or width <= 0 or height <= 0:
+        raise ValueError("map %s: width and height must be positive integers" % name)
+    boxes = map_data.get("boxes")
+    if not isinstance(boxes, list) or len(boxes) != height:
+        raise ValueError("map %s: boxes must have %d rows" % (name, height))
+    for row in boxes:
+        if not isinstance(row, list) or len(row) != width:
+            raise ValueError("map %s: every row of boxes must have %d tiles" % (name, width))
+        if any(box not in BOX_TYPES for box in row):
+            raise ValueError("map %s: unknown box type in %s" % (name, row))
+    validate_positions(name, width, height, map_data.get("tanks"), map_data.get("flag"))
+
+
+def load_json(name, file):
+    """
+    Reads a map from a JSON file with the keys width, height, boxes, tanks and flag.
+    """
+    with open(file, 'r', encoding='utf-8') as map_file_data:
+        map_data = json.load(map_file_data)
+    validate(name, map_data)
+    return Map(map_data["width"], map_data["height"], map_data["boxes"], map_data["tanks"], map_data["flag"])
+
+
+def unknown_box_type(tiles):
+    """
+    Returns whether the tiles of a binary map (a view of the file) hold a box type
+    that is not in BOX_TYPES. The tiles are read in place with NumPy, or a chunk at
+    a time without it, they are never copied as a whole.
+    """
+    if numpy is not None:
+        return int(numpy.frombuffer(tiles, dtype=numpy.uint8).max()) > max(BOX_TYPES)
+    for start in range(0, len(tiles), CHECK_CHUNK):
+        if tiles[start:start + CHECK_CHUNK].tobytes().translate(None, bytes(BOX_TYPES)):
+            return True
+    return False
+
+
+def load_binary(name, file):
+    """
+    Reads a map from a binary file. The file is mapped in memory and the tiles of
+    the map are a view of it, so they are only read from disk when used.
+    """
+    with open(file, 'rb') as map_file_data:
+        if os.fstat(map_file_data.fileno()).st_size < HEADER.size:
+            raise ValueError("map %s: the file is too short" % name)
+        data = mmap.mmap(map_file_data.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, tank_count, width, height = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("map %s: not a map file of version %d" % (name, VERSION))
+    offset = HEADER.size
+    tanks = [list(TANK.unpack_from(data, offset + index * TANK.size)) for index in range(tank_count)]
+    offset += tank_count * TANK.size
+    flag = list(FLAG.unpack_from(data, offset))
+    offset += FLAG.size
+    if width <= 0 or height <= 0 or len(data) != offset + width * height:
+        raise ValueError("map %s: the file does not hold %dx%d tiles" % (name, width, height))
+    tiles = memoryview(data)[offset:]
+    if unknown_box_type(tiles):
+        raise ValueError("map %s: unknown box type" % name)
+    validate_positions(name, width, height, tanks, flag)
+    return Map(width, height, tiles, tanks, flag)
+
+
+def save_binary(current_map, file):
+    """
+    Writes a map to a file in the binary format read by load_binary.
+    """
+    with open(file, 'wb') as map_file_data:
+        map_file_data.write(HEADER.pack(MAGIC, VERSION, len(current_map.start_positions), current_map.width, current_map.height))
+        for position in current_map.start_positions:
+            map_file_data.write(TANK.pack(*position))
+        map_file_data.write(FLAG.pack(*current_map.flag_position))
+        map_file_data.write(current_map.tiles)
+
+
+def load_map(name):
+    """
+    Load the map maps/<name>.ctfmap or maps/<name>.json and return it as a Map. The map
+    is read the first time and again only when its file has been modified since.
+    """
+    file = map_file(name)
+    if file is None:
+        raise FileNotFoundError("there is no map called %s in %s" % (name, os.path.join(main_dir, 'maps')))
+    modified = os.stat(file).st_mtime_ns
+    cached = cache.get(name)
+    if cached is not None and cached[:2] == (file, modified):
+        return cached[2]
+    if file.endswith('.json'):
+        loaded = load_json(name, file)
+    else:
+        loaded = load_binary(name, file)
+    loaded.name = name
+    cache[name] = (file, modified, loaded)
+    return loaded
+
+
+def __getattr__(name):
+    """
+    Lets maps.map0 (and any other map of the maps directory) be used as before, it is loaded when used.
+    """
+    if name.startswith('_') or map_file(name) is None:
+        raise AttributeError("module 'maps' has no attribute '%s'" % name)
+    return load_map(name)
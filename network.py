@@ -0,0 +1,120 @@
+"""
+The protocol between server.py and client.py. Both ends load the map, so only
+what moves is sent: the server turns the tanks, bullets, boxes, flag and
+explosions of its session into entity states (whole pixels and rotation
+steps, like the renderer draws them) and every tick sends the states that
+changed since the previous tick.
+
+Every message from the server is a 4 byte length followed by JSON. The first
+one is the hello (map, tank of the client, tick rate), then one snapshot per
+tick: {"tick": ..., "full": ..., "set": {key: state}, "del": [keys]}. A full
+snapshot replaces the whole state of the client. Messages from a client are
+one byte each, a command of simulation.ACCELERATE to simulation.STOP_TURNING.
+"""
+import json
+import struct
+
+import gameobjects
+import simulation
+
+LENGTH = struct.Struct('<I')
+COMMAND = struct.Struct('<B')
+
+PLAYER_COMMANDS = range(simulation.ACCELERATE, simulation.STOP_TURNING + 1)
+
+#  The first letter of the key of each kind of entity
+TANK = 't'
+BULLET = 'b'
+WOOD_BOX = 'w'
+METAL_BOX = 'm'
+FLAG = 'f'
+EXPLOSION = 'e'
+SCORES = 's'
+
+DRAW_ORDER = {WOOD_BOX: 0, METAL_BOX: 0, TANK: 1, BULLET: 2, EXPLOSION: 3, FLAG: 4}  # Entities drawn on top come last
+
+BOX_KINDS = {2: WOOD_BOX, 3: METAL_BOX}  # Map.boxAt type -> key letter
+
+
+def pose(obj):
+    """
+    Returns where an object is drawn, in whole pixels and rotation steps.
+    """
+    position = obj.screen_position()
+    return [round(position.x), round(position.y), round(obj.screen_orientation() / gameobjects.ROTATION_STEP)]
+
+
+def box_keys(session):
+    """
+    Returns the key of every movable box of a session. They stay the same for the
+    whole session, a destroyed box that comes back in a new round gets its key back.
+    """
+    return {box: BOX_KINDS[box.box_type] + str(index) for index, box in enumerate(session.grid.box_tiles)}
+
+
+def entity_states(session, keys):
+    """
+    Returns the state of every entity of a session, key -> list of numbers.
+    keys are the keys of the boxes, from box_keys.
+    """
+    session.update_bullet_bodies()
+    states = {}
+    for index, tank in enumerate(session.tanks_list):
+        states[TANK + str(index)] = pose(tank) + [tank.hp, int(tank.spawn_protection)]
+    for bullet in session.bullets_list:
+        states[BULLET + format(id(bullet), 'x')] = pose(bullet)
+    for obj in session.game_objects_list:
+        key = keys.get(obj)
+        if key is not None:
+            states[key] = pose(obj)
+    for explosion in session.explosion_list:
+        states[EXPLOSION + format(id(explosion), 'x')] = pose(explosion)
+    states[FLAG] = pose(session.flag)
+    states[SCORES] = list(session.current_scores())
+    return states
+
+
+def encode(data):
+    """
+    Returns a message, its length followed by data as JSON.
+    """
+    payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    return LENGTH.pack(len(payload)) + payload
+
+
+def snapshot(tick, previous, current):
+    """
+    Returns the snapshot message that turns the states previous into current,
+    or a full snapshot if previous is None.
+    """
+    if previous is None:
+        return encode({"tick": tick, "full": True, "set": current, "del": []})
+    changed = {key: state for key, state in current.items() if previous.get(key) != state}
+    removed = [key for key in previous if key not in current]
+    return encode({"tick": tick, "full": False, "set": changed, "del": removed})
+
+
+async def read_payload(reader):
+    """
+    Reads one message from an asyncio stream and returns its JSON, undecoded.
+    """
+    length, = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+    return await reader.readexactly(length)
+
+
+async def read_message(reader):
+    """
+    Reads one message from an asyncio stream and returns its data.
+    """
+    return json.loads((await read_payload(reader)).decode('utf-8'))
+
+
+def apply_snapshot(states, message):
+    """
+    Updates the states of the entities kept by a client with a snapshot.
+    """
+    if message["full"]:
+        states.clear()
+    states.update(message["set"])
+    for key in message["del"]:
+        states.pop(key, None)
@@ -0,0 +1,273 @@
+"""
+Shared path finding for the AIs. Instead of every AI running its own breadth
+first search, one distance field is computed per goal tile with a reverse
+breadth first search and shared by every AI heading for that tile.
+"""
+import heapq
+from collections import OrderedDict, deque
+
+from pymunk import Vec2d
+
+MAX_FIELDS = 64  # Number of distance fields kept before the least recently used is dropped
+MAX_CHANGES = 1024  # Changes of the grid kept at most, a field further behind is computed again
+INFINITY = float("inf")  # Distance of a tile that can not reach the goal, while repairing
+
+#  Order in which neighbors are visited: up, down, left, right
+DIRECTIONS = [(0, -1), (0, 1), (-1, 0), (1, 0)]
+
+
+def is_passable(box_type, allow_metal):
+    """
+    A tile can be driven through if it is grass or a wooden box, or a metal
+    box when allow_metal is set.
+    """
+    return box_type == 0 or box_type == 2 or (box_type == 3 and allow_metal)
+
+
+def search_field(tiles, width, height, goal_x, goal_y, allow_metal):
+    """
+    Reverse breadth first search from the goal tile over the box types of a map,
+    given one byte per tile (x + y * width). Every tile gets the number of moves
+    needed to reach the goal. A tile that can not be driven through still gets a
+    distance (a tank may start on it) but the search does not continue from it.
+    Returns the field and the number of tiles the search went through. Needs
+    nothing but its arguments, so it can run in another process.
+    """
+    field = [-1] * (width * height)
+    if not (0 <= goal_x < width and 0 <= goal_y < height):
+        return field, 0
+    field[goal_x + goal_y * width] = 0
+    if not is_passable(tiles[goal_x + goal_y * width], allow_metal):
+        return field, 1
+    expanded = 0
+    queue = deque()
+    queue.append((goal_x, goal_y))
+    while queue:
+        x, y = queue.popleft()
+        expanded += 1
+        distance = field[x + y * width] + 1
+        for dx, dy in DIRECTIONS:
+            nx = x + dx
+            ny = y + dy
+            if 0 <= nx < width and 0 <= ny < height and field[nx + ny * width] == -1:
+                field[nx + ny * width] = distance
+                if is_passable(tiles[nx + ny * width], allow_metal):
+                    queue.append((nx, ny))
+    return field, expanded
+
+
+class FlowFields:
+    """
+    Distance fields towards goal tiles, shared by all the AIs of a game. The grid
+    needs width, height and boxAt(x, y). If it also has a version and a list of
+    changes (see maps.OccupancyGrid), a field is kept between changes and only
+    the part of it that a change affects is repaired (Lifelong Planning A*).
+    Since the search starts from the goal, a tank moving along its path never
+    requires any search at all.
+    """
+
+    def __init__(self, grid, max_fields=MAX_FIELDS):
+        self.grid = grid
+        self.max_fields = max_fields
+        self.fields = OrderedDict()  # [field, version of the grid it is valid for] per goal
+        self.computed = 0  # Number of distance fields computed, for profiling
+        self.repaired = 0  # Number of distance fields repaired, for profiling
+        self.expanded = 0  # Number of tiles the searches went through, the work the AI scheduler budgets
+
+    def distance_field(self, goal, allow_metal):
+        """
+        Returns the distance field of the goal tile as a flat list indexed by
+        x + y * width, where -1 means that the tile can not reach the goal.
+        """
+        version = getattr(self.grid, "version", 0)
+        key = (int(goal[0]), int(goal[1]), allow_metal)
+        entry = self.fields.get(key)
+        if entry is None:
+            entry = [self.compute_field(key[0], key[1], allow_metal), version]
+            self.fields[key] = entry
+            if len(self.fields) > self.max_fields:
+                self.fields.popitem(last=False)
+        else:
+            if entry[1] != version:
+                changed_tiles = self.changed_tiles(entry, allow_metal)
+                if changed_tiles is None:
+                    entry[0] = self.compute_field(key[0], key[1], allow_metal)
+                elif changed_tiles:
+                    self.repair_field(entry[0], changed_tiles, key[0], key[1], allow_metal)
+                entry[1] = version
+            self.fields.move_to_end(key)
+        return entry[0]
+
+    def changed_tiles(self, entry, allow_metal):
+        """
+        Goes through the changes of the grid since the field was last updated and
+        returns the tiles that matter to it: those whose passability changed and that
+        the search reached, or that border a reached tile. Returns None if the grid
+        does not keep a list of changes, or no longer has those of the field.
+        """
+        changes_since = getattr(self.grid, "changes_since", None)
+        if changes_since is None:
+            return None
+        field, version = entry
+        changes = changes_since(version)
+        if changes is None:
+            return None
+        width = self.grid.width
+        height = self.grid.height
+        changed_tiles = []
+        for x, y, old_type, new_type in changes:
+            if is_passable(old_type, allow_metal) == is_passable(new_type, allow_metal):
+                continue
+            reached = field[x + y * width] != -1
+            for dx, dy in DIRECTIONS:
+                nx = x + dx
+                ny = y + dy
+                if 0 <= nx < width and 0 <= ny < height and field[nx + ny * width] != -1:
+                    reached = True
+            if reached:
+                changed_tiles.append((x, y))
+        return changed_tiles
+
+    def repair_field(self, field, changed_tiles, goal_x, goal_y, allow_metal):
+        """
+        Repairs the field in place after the passability of changed_tiles changed.
+        This is Lifelong Planning A* without heuristic: tiles whose distance no
+        longer matches the best distance through their neighbors are put in a
+        priority queue and fixed, and the fix is spread only as far as distances
+        actually change.
+        """
+        self.repaired += 1
+        width = self.grid.width
+        height = self.grid.height
+        goal = goal_x + goal_y * width
+        queue = []
+
+        def best_distance(x, y):
+            #  The distance the tile should have according to its neighbors
+            if x + y * width == goal:
+                return 0
+            best = INFINITY
+            for dx, dy in DIRECTIONS:
+                nx = x + dx
+                ny = y + dy
+                if 0 <= nx < width and 0 <= ny < height:
+                    distance = field[nx + ny * width]
+                    if distance != -1 and distance + 1 < best and is_passable(self.grid.boxAt(nx, ny), allow_metal):
+                        best = distance + 1
+            return best
+
+        def update_tile(x, y):
+            distance = field[x + y * width]
+            current = INFINITY if distance == -1 else distance
+            best = best_distance(x, y)
+            if current != best:
+                heapq.heappush(queue, (min(current, best), x, y))
+
+        def update_neighbors(x, y):
+            for dx, dy in DIRECTIONS:
+                nx = x + dx
+                ny = y + dy
+                if 0 <= nx < width and 0 <= ny < height:
+                    update_tile(nx, ny)
+
+        for x, y in changed_tiles:
+            update_tile(x, y)
+            update_neighbors(x, y)
+        while queue:
+            key, x, y = heapq.heappop(queue)
+            self.expanded += 1
+            distance = field[x + y * width]
+            current = INFINITY if distance == -1 else distance
+            best = best_distance(x, y)
+            if current == best or key != min(current, best):
+                continue  # Already fixed, or an outdated entry of the queue
+            if current > best:
+                field[x + y * width] = best
+            else:
+                field[x + y * width] = -1
+                update_tile(x, y)
+            update_neighbors(x, y)
+
+    def compute_field(self, goal_x, goal_y, allow_metal):
+        """
+        Computes the distance field of the goal tile on the current grid (see search_field).
+        """
+        tiles = getattr(self.grid, "cells", None)
+        if tiles is None:
+            tiles = self.grid.tiles  # A maps.Map instead of an OccupancyGrid
+        field, expanded = search_field(tiles, self.grid.width, self.grid.height, goal_x, goal_y, allow_metal)
+        if expanded:
+            self.computed += 1
+        self.expanded += expanded
+        return field
+
+    def install(self, goal_x, goal_y, allow_metal, field, version):
+        """
+        Adds a field computed elsewhere (see pathplanner.py) on the grid of version
+        version. If the grid changed since, the field is repaired when it is used.
+        """
+        self.computed += 1
+        self.fields[(goal_x, goal_y, allow_metal)] = [field, version]
+        if len(self.fields) > self.max_fields:
+            self.fields.popitem(last=False)
+
+    def trim_changes(self, oldest=None):
+        """
+        Lets the grid forget the changes that every field has caught up with. oldest
+        is the version of a field that is still being searched (see pathplanner.py),
+        its changes are kept too. A field that was not used for MAX_CHANGES changes
+        does not keep them.
+        """
+        trim = getattr(self.grid, "trim", None)
+        if trim is None:
+            return
+        versions = [entry[1] for entry in self.fields.values()]
+        if oldest is not None:
+            versions.append(oldest)
+        trim(max(min(versions, default=self.grid.version), self.grid.version - MAX_CHANGES))
+
+    def distance(self, tile, goal, allow_metal):
+        """
+        Returns the number of moves from tile to goal, or None if the goal can not be reached.
+        """
+        x, y = int(tile[0]), int(tile[1])
+        if not (0 <= x < self.grid.width and 0 <= y < self.grid.height):
+            return None
+        distance = self.distance_field(goal, allow_metal)[x + y * self.grid.width]
+        if distance == -1:
+            return None
+        return distance
+
+    def next_tile(self, tile, goal, allow_metal):
+        """
+        Returns the neighbor of tile that is one move closer to the goal, or None.
+        """
+        field = self.distance_field(goal, allow_metal)
+        width = self.grid.width
+        x, y = int(tile[0]), int(tile[1])
+        if not (0 <= x < width and 0 <= y < self.grid.height) or field[x + y * width] <= 0:
+            return None
+        wanted = field[x + y * width] - 1
+        for dx, dy in DIRECTIONS:
+            nx = x + dx
+            ny = y + dy
+            if 0 <= nx < width and 0 <= ny < self.grid.height and field[nx + ny * width] == wanted:
+                #  Only passable tiles are expanded, so a tile closer to the goal can be driven through
+                if wanted == 0 or is_passable(self.grid.boxAt(nx, ny), allow_metal):
+                    return Vec2d(nx, ny)
+        return None
+
+    def path(self, start, goal, allow_metal):
+        """
+        Returns the shortest path from start to goal as a deque of tiles (start
+        excluded, goal included), or None if the goal can not be reached.
+        """
+        if self.distance(start, goal, allow_metal) is None:
+            return None
+        path = deque()
+        tile = self.next_tile(start, goal, allow_metal)
+        while tile is not None:
+            self.expanded += 1
+            path.append(tile)
+            tile = self.next_tile(tile, goal, allow_metal)
+        return path
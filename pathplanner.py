@@ -0,0 +1,128 @@
+"""
+Searches the distance fields of the AIs in the background. When an AI needs a
+field that is not known yet, the search is sent to a pool of worker processes
+with a copy of the occupancy grid (one byte per tile) instead of blocking the
+tick, and the AI keeps waiting for its plan (see aischeduler.py).
+
+A field is handed back exactly delay ticks after it was asked for, so the game
+plays the same whether the search ran in a worker, or in the game itself
+because there is no pool (a replay, a batch worker). The game only waits for
+a worker that takes longer than delay ticks.
+
+A field found on a grid that changed since is repaired when it is used (see
+FlowFields.install), and an AI whose target moved meanwhile does not use it
+and asks for the field of its new target.
+
+There is one pool of workers for the whole program, started by the first
+session that needs it and stopped when the last one is closed. The workers
+are new processes (spawn), they do not inherit pygame or the game.
+"""
+import concurrent.futures
+import multiprocessing
+import time
+
+import pathfinding
+
+DELAY = 2  # Ticks between asking for a field and getting it
+LARGE_MAP = 400  # Maps with at least this many tiles search in the background when the game is shown
+
+executor = None  # The pool of worker processes, see open_pool
+users = 0  # Number of planners using the pool
+
+
+def delay_for(current_map):
+    """
+    Returns the delay to play a map with, 0 (search in the tick) for small maps.
+    """
+    return DELAY if current_map.width * current_map.height >= LARGE_MAP else 0
+
+
+def open_pool(workers):
+    """
+    Returns the pool of worker processes, started with workers workers if it is
+    not running yet. Every call must be matched by a call to close_pool.
+    """
+    global executor, users
+    if executor is None:
+        executor = concurrent.futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        #  New processes take a while to start, the game waits for them now rather than on its first search
+        executor.submit(pathfinding.is_passable, 0, False).result()
+    users += 1
+    return executor
+
+
+def close_pool():
+    """
+    Stops the pool of worker processes once no planner uses it anymore.
+    """
+    global executor, users
+    users -= 1
+    if users == 0 and executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+        executor = None
+
+
+class PathPlanner:
+    """
+    The searches asked for by the AIs of a session, and the workers that run them.
+    """
+
+    def __init__(self, flow_fields, delay=DELAY, workers=1):
+        """
+        Takes as argument the flow fields to add the results to, the delay in ticks
+        and the number of worker processes (0 to search in the game, at the delay).
+        """
+        self.flow_fields = flow_fields
+        self.delay = delay
+        self.executor = open_pool(workers) if workers else None
+        self.searches = {}  # (goal x, goal y, allow_metal) -> (tick asked, grid version, tiles, future)
+        self.waited = 0.0  # Seconds the game waited for the workers, for profiling
+
+    def ready(self, my_ai, tick):
+        """
+        Returns whether the field an AI needs to plan is known. If not, its search
+        is started and the AI asks again on the next ticks.
+        """
+        goal = my_ai.get_target_tile()
+        key = (int(goal[0]), int(goal[1]), my_ai.allow_metal)
+        if key in self.flow_fields.fields:
+            return True
+        if key not in self.searches:
+            grid = self.flow_fields.grid
+            tiles = bytes(grid.cells)
+            future = None
+            if self.executor is not None:
+                future = self.executor.submit(pathfinding.search_field, tiles, grid.width, grid.height, *key)
+            self.searches[key] = (tick, grid.version, tiles, future)
+        return False
+
+    def deliver(self, tick):
+        """
+        Adds the fields whose delay is over to the flow fields.
+        """
+        grid = self.flow_fields.grid
+        for key, (asked, version, tiles, future) in list(self.searches.items()):
+            if tick - asked < self.delay:
+                continue
+            if future is None:
+                field, expanded = pathfinding.search_field(tiles, grid.width, grid.height, *key)
+            else:
+                start = time.perf_counter()
+                field, expanded = future.result()
+                self.waited += time.perf_counter() - start
+            self.flow_fields.install(*key, field, version)
+            del self.searches[key]
+
+    def oldest_version(self):
+        """
+        Returns the oldest grid version a search was started on, or None if there is no search.
+        """
+        return min((version for asked, version, tiles, future in self.searches.values()), default=None)
+
+    def close(self):
+        """
+        Stops using the workers, they are stopped if no other planner uses them.
+        """
+        if self.executor is not None:
+            close_pool()
+            self.executor = None
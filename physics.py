@@ -0,0 +1,144 @@
+"""
+Physics profiles: how the pymunk space of a game is set up (the index of the
+shapes, the solver iterations, the sleeping of resting bodies and the collision
+slop). Each map can have its own profile, measured by physicsbench.py and kept
+in data/physics.json; maps without one use the pymunk defaults.
+
+Profiles that let bodies sleep are never locked: the game no longer plays the
+same from one process to the next with sleeping, which breaks the replays and
+the batches.
+"""
+import json
+import math
+import os
+
+import images
+
+main_dir = os.path.split(os.path.abspath(__file__))[0]
+PROFILES_FILE = os.path.join(main_dir, 'data', 'physics.json')
+
+#  The profiles read from PROFILES_FILE, map name -> settings
+locked_profiles = None
+
+
+class PhysicsProfile:
+    """
+    The settings of a pymunk space. Sizes are in pixels, like images.TILE_SIZE,
+    and speeds in tiles per second.
+    """
+
+    def __init__(self, name, spatial_hash=False, cell_size=images.TILE_SIZE, iterations=10,
+                 sleep_time=math.inf, idle_speed=0.0, collision_slop=0.1):
+        """
+        Takes as argument the name of the profile, whether shapes are indexed by a
+        spatial hash (instead of pymunk's bounding box tree) and the size of its cells,
+        the number of solver iterations, how long a body must be idle (slower than
+        idle_speed) before it sleeps and how much shapes may overlap (collision_slop).
+        """
+        self.name = name
+        self.spatial_hash = spatial_hash
+        self.cell_size = cell_size
+        self.iterations = iterations
+        self.sleep_time = sleep_time
+        self.idle_speed = idle_speed
+        self.collision_slop = collision_slop
+
+    def apply(self, space, current_map):
+        """
+        Sets up a space for a map, before the shapes of the map are added.
+        """
+        space.iterations = self.iterations
+        space.collision_slop = self.collision_slop
+        space.sleep_time_threshold = self.sleep_time
+        space.idle_speed_threshold = self.idle_speed
+        if self.spatial_hash:
+            #  The physics works in tiles, and the hash needs about one cell per tile of the map
+            cell = self.cell_size / images.TILE_SIZE
+            cells = math.ceil(current_map.width / cell) * math.ceil(current_map.height / cell)
+            space.use_spatial_hash(cell, max(cells, 1))
+
+    def sleeps(self):
+        """
+        Returns whether resting bodies are put to sleep.
+        """
+        return not math.isinf(self.sleep_time)
+
+    def to_dict(self):
+        """
+        Returns the settings as a dictionary that can be written as JSON.
+        """
+        settings = dict(vars(self))
+        if math.isinf(settings["sleep_time"]):
+            settings["sleep_time"] = None  # JSON has no infinity
+        return settings
+
+    @classmethod
+    def from_dict(cls, settings):
+        """
+        Creates a profile from a dictionary made by to_dict.
+        """
+        settings = dict(settings)
+        if settings.get("sleep_time") is None:
+            settings["sleep_time"] = math.inf
+        return cls(**settings)
+
+
+DEFAULT = PhysicsProfile("default")  # The settings of a new pymunk space
+
+
+def candidate_profiles():
+    """
+    Returns the profiles that physicsbench.py compares.
+    """
+    return [
+        DEFAULT,
+        PhysicsProfile("hash", spatial_hash=True),
+        PhysicsProfile("hash_2x", spatial_hash=True, cell_size=2 * images.TILE_SIZE),
+        PhysicsProfile("sleep", sleep_time=0.5, idle_speed=0.05),
+        PhysicsProfile("hash_sleep", spatial_hash=True, sleep_time=0.5, idle_speed=0.05),
+        PhysicsProfile("hash_sleep_fast", spatial_hash=True, sleep_time=0.5, idle_speed=0.05, iterations=5),
+        PhysicsProfile("hash_sleep_tight", spatial_hash=True, sleep_time=0.5, idle_speed=0.05, collision_slop=0.02),
+    ]
+
+
+def load_profiles():
+    """
+    Returns the locked profiles of the maps, read from PROFILES_FILE the first time.
+    """
+    global locked_profiles
+    if locked_profiles is None:
+        locked_profiles = {}
+        if os.path.isfile(PROFILES_FILE):
+            with open(PROFILES_FILE, 'r', encoding='utf-8') as file:
+                locked_profiles = json.load(file)
+    return locked_profiles
+
+
+def profile_for(current_map):
+    """
+    Returns the profile locked for a map, or DEFAULT if it has none.
+    """
+    settings = load_profiles().get(current_map.name)
+    return PhysicsProfile.from_dict(settings) if settings else DEFAULT
+
+
+def lock_profile(map_name, profile):
+    """
+    Saves the profile to use for a map in PROFILES_FILE.
+    """
+    if profile.sleeps():
+        raise ValueError("profile %s lets bodies sleep, the game would not be deterministic" % profile.name)
+    profiles = load_profiles()
+    profiles[map_name] = profile.to_dict()
+    with open(PROFILES_FILE, 'w', encoding='utf-8') as file:
+        json.dump(profiles, file, indent=4, sort_keys=True)
+
+
+def unlock_profile(map_name):
+    """
+    Removes the profile locked for a map from PROFILES_FILE, the map uses DEFAULT again.
+    """
+    profiles = load_profiles()
+    if profiles.pop(map_name, None) is not None:
+        with open(PROFILES_FILE, 'w', encoding='utf-8') as file:
+            json.dump(profiles, file, indent=4, sort_keys=True)
@@ -0,0 +1,157 @@
+"""
+Command line benchmark of the physics profiles (see physics.py). Plays the same
+headless all AI match on a map with every candidate profile, reports the time
+spent in space.step and whether the physics stayed stable, and can lock the
+fastest stable profile of each map into data/physics.json. A profile is only
+locked if it lets no body sleep and plays the same match the same way in two
+separate processes, as the replays and the batches need.
+
+Example:
+    python3 physicsbench.py --maps map0 map1 --ticks 1500 --lock
+"""
+import argparse
+import math
+import multiprocessing
+import statistics
+import time
+
+import gameobjects
+import simulation
+import maps
+import physics
+import sounds
+
+sounds.muted = True  # The matches are played without audio
+
+MAX_PENETRATION = 0.2  # A profile is unstable if shapes overlap deeper than this (in tiles)
+CHECK_INTERVAL = 25  # Ticks between two stability checks
+
+
+def penetration(session):
+    """
+    Returns how deep the tanks and the boxes sink into boxes, walls and the border of
+    the map (in tiles), or infinity if one of them left the map. Tanks overlapping each
+    other are left out, a tank can respawn on top of another one.
+    """
+    deepest = 0.0
+    width = session.current_map.width
+    height = session.current_map.height
+    scenery = (gameobjects.BOX_COLLISION_TYPE, gameobjects.BORDER_COLLISION_TYPE)
+    for shape in session.space.shapes:
+        body = shape.body
+        if body.body_type != body.DYNAMIC or shape.collision_type not in (gameobjects.TANK_COLLISION_TYPE, gameobjects.BOX_COLLISION_TYPE):
+            continue
+        x, y = body.position
+        if not (-1 <= x <= width + 1 and -1 <= y <= height + 1) or math.isnan(x) or math.isnan(y):
+            return math.inf
+        for info in session.space.shape_query(shape):
+            if info.shape.collision_type in scenery:
+                for point in info.contact_point_set.points:
+                    deepest = max(deepest, -point.distance)
+    return deepest
+
+
+def run(current_map, profile, ticks, seed):
+    """
+    Plays ticks ticks of a match with a profile, the AIs started with a seed (see
+    simulation.START_JITTER). Returns the time spent in space.step (in seconds) and
+    the deepest overlap seen.
+    """
+    session = simulation.GameSession(current_map, all_ai=True, physics_profile=profile, seed=seed)
+    space = session.space
+    step = space.step
+    spent = [0.0]
+
+    def timed_step(dt):
+        start = time.perf_counter()
+        step(dt)
+        spent[0] += time.perf_counter() - start
+
+    space.step = timed_step
+    deepest = 0.0
+    for tick in range(ticks):
+        if session.winner is not None:
+            break
+        session.step(1)
+        if tick % CHECK_INTERVAL == 0:
+            deepest = max(deepest, penetration(session))
+    return spent[0] / max(session.frames, 1), deepest
+
+
+def final_state(session):
+    """
+    Returns what a match ended on: its ticks, the scores and the pose and speed
+    of every moving body, exactly.
+    """
+    bodies = [(tuple(body.position), body.angle, tuple(body.velocity), body.angular_velocity)
+              for body in session.space.bodies if body.body_type == body.DYNAMIC]
+    return session.ticks, session.frames, list(session.scores), bodies
+
+
+def play(job):
+    """
+    Plays ticks ticks of a match on a map with a profile, in a worker process,
+    and returns its final state.
+    """
+    map_name, settings, ticks, seed = job
+    session = simulation.GameSession(maps.load_map(map_name), all_ai=True,
+                                     physics_profile=physics.PhysicsProfile.from_dict(settings), seed=seed)
+    session.step(ticks)
+    return final_state(session)
+
+
+def deterministic(map_name, profile, ticks, seed):
+    """
+    Returns whether a match with a profile ends on the same state when it is played
+    twice, each time in a new process.
+    """
+    context = multiprocessing.get_context("spawn")  # Nothing is inherited from this process
+    with context.Pool(2, maxtasksperchild=1) as pool:
+        first, second = pool.map(play, [(map_name, profile.to_dict(), ticks, seed)] * 2, chunksize=1)
+    return first == second
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the physics profiles on maps.")
+    parser.add_argument("--maps", nargs="+", default=maps.available_maps(), help="names of the maps in maps/")
+    parser.add_argument("--ticks", type=int, default=1000, help="ticks played with each profile")
+    parser.add_argument("--repeats", type=int, default=3, help="number of matches per profile, the median is reported")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first match, the repeats use seed + 1, ...")
+    parser.add_argument("--lock", action="store_true", help="save the fastest stable and deterministic profile of each map")
+    args = parser.parse_args()
+
+    for map_name in args.maps:
+        current_map = maps.load_map(map_name)
+        print(f"{map_name} ({current_map.width}x{current_map.height}):")
+        stable_profiles = []
+        for profile in physics.candidate_profiles():
+            runs = [run(current_map, profile, args.ticks, args.seed + repeat) for repeat in range(args.repeats)]
+            step_time = statistics.median(step_time for step_time, deepest in runs)
+            deepest = max(deepest for step_time, deepest in runs)
+            stable = deepest <= MAX_PENETRATION
+            print(f"    {profile.name:<18} space.step {step_time * 1e6:8.1f} us, deepest overlap {deepest:.3f}"
+                  f"{'' if stable else '  UNSTABLE'}")
+            if stable:
+                stable_profiles.append((step_time, profile))
+        stable_profiles.sort(key=lambda item: item[0])
+        if not stable_profiles:
+            print("    no stable profile")
+        elif not args.lock:
+            print(f"    fastest stable: {stable_profiles[0][1].name}")
+        else:
+            for step_time, profile in stable_profiles:
+                if profile.sleeps():
+                    print(f"    {profile.name} lets bodies sleep, not locked")
+                elif not deterministic(map_name, profile, args.ticks, args.seed):
+                    print(f"    {profile.name} does not play the same in two processes, not locked")
+                else:
+                    physics.lock_profile(map_name, profile)
+                    print(f"    locked {profile.name}")
+                    break
+            else:
+                physics.unlock_profile(map_name)
+                print("    no deterministic profile, the map uses the default")
+
+
+if __name__ == "__main__":
+    main()
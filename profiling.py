@@ -0,0 +1,168 @@
+"""
+Per-phase timing of the game loop. The loop calls lap(phase) at the end of each
+phase (events, tanks, AIs, space.step, drawing, ...) and the time since the
+previous lap is added to that phase. Work that happens inside another phase
+(collision callbacks inside space.step, sprite rotation inside drawing) is
+added with add and taken out of the phase around it, so the phases of a frame
+add up to the length of the frame.
+"""
+import collections
+import csv
+import json
+import time
+
+import pygame
+
+WINDOW = 600  # Number of frames the rolling percentiles are computed on
+OVERLAY_REFRESH = 0.5  # Seconds between two updates of the numbers of the overlay
+
+
+def percentile(values, fraction):
+    """
+    Returns the value below which fraction of the sorted values are (nearest rank).
+    """
+    if not values:
+        return 0.0
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+class Profiler:
+    """
+    Measures how long each phase of each frame takes, keeps the last WINDOW frames
+    for the rolling percentiles and, if asked for, every frame of the match for the
+    export. Without keep_frames the memory it uses does not grow with the match.
+    """
+
+    def __init__(self, window=WINDOW, keep_frames=True):
+        """
+        Takes as argument the number of frames of the rolling percentiles and whether
+        every frame is kept for write_csv and write_json.
+        """
+        self.window = window
+        self.keep_frames = keep_frames
+        self.samples = {}  # The duration of a phase in the last frames
+        self.totals = collections.Counter()  # Time spent in each phase during the whole match
+        self.frames = []  # The duration of each phase, one dictionary per frame, if keep_frames
+        self.frame_count = 0
+        self.current = {}
+        self.last = time.perf_counter()
+        self.nested = 0.0  # Time added with add since the last lap
+        self.font = None
+        self.overlay = None
+        self.overlay_time = 0.0
+
+    def start_frame(self):
+        """
+        Starts a new frame, the time since the end of the previous one is not counted.
+        """
+        self.current = {}
+        self.nested = 0.0
+        self.last = time.perf_counter()
+
+    def lap(self, phase):
+        """
+        Ends a phase, the time since the previous lap is added to it.
+        """
+        now = time.perf_counter()
+        self.current[phase] = self.current.get(phase, 0.0) + now - self.last - self.nested
+        self.nested = 0.0
+        self.last = now
+
+    def add(self, phase, seconds):
+        """
+        Adds time measured inside an other phase, it is taken out of that phase.
+        """
+        self.current[phase] = self.current.get(phase, 0.0) + seconds
+        self.nested += seconds
+
+    def end_frame(self):
+        """
+        Ends the frame and stores the duration of its phases.
+        """
+        for phase in self.samples.keys() | self.current.keys():
+            if phase not in self.samples:
+                self.samples[phase] = collections.deque([0.0] * min(self.frame_count, self.window), self.window)
+            self.samples[phase].append(self.current.get(phase, 0.0))
+        self.totals.update(self.current)
+        if self.keep_frames:
+            self.frames.append(self.current)
+        self.frame_count += 1
+        self.start_frame()
+
+    def summary(self):
+        """
+        Returns, for each phase, the rolling p50, p95 and p99 (in seconds) and the
+        total time and share of the whole match.
+        """
+        total = sum(self.totals.values()) or 1.0
+        result = {}
+        for phase, samples in self.samples.items():
+            values = sorted(samples)
+            result[phase] = {
+                "p50": percentile(values, 0.50),
+                "p95": percentile(values, 0.95),
+                "p99": percentile(values, 0.99),
+                "total": self.totals[phase],
+                "share": self.totals[phase] / total,
+            }
+        return result
+
+    def write_csv(self, file):
+        """
+        Writes the duration of every phase of every frame (in seconds) to a CSV file.
+        """
+        phases = list(self.totals)
+        with open(file, 'w', newline='', encoding='utf-8') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(["frame"] + phases)
+            for index, frame in enumerate(self.frames):
+                writer.writerow([index] + [frame.get(phase, 0.0) for phase in phases])
+
+    def write_json(self, file):
+        """
+        Writes the summary and the duration of every phase of every frame to a JSON file.
+        """
+        with open(file, 'w', encoding='utf-8') as json_file:
+            json.dump({"summary": self.summary(), "frames": self.frames}, json_file)
+
+    def draw(self, screen):
+        """
+        Draws the percentiles of the phases in the top left corner of the screen and
+        returns the rectangle that was drawn. The numbers are updated every OVERLAY_REFRESH seconds.
+        """
+        now = time.perf_counter()
+        if self.overlay is None or now - self.overlay_time > OVERLAY_REFRESH:
+            if self.font is None:
+                self.font = pygame.font.SysFont("monospace", 14)
+            summary = sorted(self.summary().items(), key=lambda item: -item[1]["p95"])
+            lines = [f"{'phase':<14}{'p50':>6} {'p95':>6} {'p99':>6} (ms)"]
+            lines += [f"{phase:<14}{entry['p50'] * 1000:6.2f} {entry['p95'] * 1000:6.2f} {entry['p99'] * 1000:6.2f}"
+                      for phase, entry in summary]
+            rendered = [self.font.render(line, True, (255, 255, 255)) for line in lines]
+            self.overlay = pygame.Surface((max(text.get_width() for text in rendered) + 8, 14 * len(rendered) + 6))
+            self.overlay.fill((0, 0, 0))
+            for index, text in enumerate(rendered):
+                self.overlay.blit(text, (4, 3 + 14 * index))
+            self.overlay_time = now
+        return screen.blit(self.overlay, (0, 0))
+
+
+class NullProfiler:
+    """
+    Used when the game is not profiled, every method does nothing.
+    """
+
+    def start_frame(self):
+        return
+
+    def lap(self, phase):
+        return
+
+    def add(self, phase, seconds):
+        return
+
+    def end_frame(self):
+        return
+
+
+NULL_PROFILER = NullProfiler()
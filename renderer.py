@@ -0,0 +1,137 @@
+"""
+Draws a game session on the screen. Objects that do not move (the floor, the
+bases and the boxes at rest) are baked into a static layer, and each frame
+only the parts of the screen where something moved or changed are redrawn.
+"""
+import pygame
+import pymunk
+import gameobjects
+import images
+
+
+def box_pose(box):
+    """
+    Returns where a box is drawn, in whole pixels and rotation steps, so that
+    changes too small to be seen do not count as a move.
+    """
+    x, y = box.body.position
+    angle = round(box.screen_orientation() / gameobjects.ROTATION_STEP)
+    return (round(x * images.TILE_SIZE), round(y * images.TILE_SIZE), angle)
+
+
+class Renderer:
+    """
+    Keeps the static layer and the sprites drawn on the previous frame of a session.
+    """
+
+    def __init__(self, screen, background, session):
+        """
+        Takes as argument the display surface, the floor and the session to draw.
+        """
+        self.screen = screen
+        self.background = background
+        self.session = session
+        self.static_layer = pygame.Surface(screen.get_size())
+        self.baked_boxes = {}  # The pose of every movable box in the static layer
+        self.grid_version = None
+        self.drawn = {}  # The sprite and rectangle of every object drawn on the last frame
+        self.full_redraw = True
+        self.rebuilds = 0  # Number of times the static layer was built, for profiling
+        self.bake()
+
+    def bake(self):
+        """
+        Draws the floor, the boxes and the bases into the static layer.
+        """
+        self.static_layer.blit(self.background, (0, 0))
+        self.baked_boxes = {}
+        for obj in self.session.game_objects_list:
+            if isinstance(obj, gameobjects.Flag):
+                continue
+            obj.update_screen(self.static_layer)
+            if isinstance(obj, gameobjects.Box) and obj.body.body_type == pymunk.Body.DYNAMIC:
+                self.baked_boxes[obj] = box_pose(obj)
+        self.grid_version = self.session.grid.version
+        self.rebuilds += 1
+
+    def static_layer_changed(self):
+        """
+        The static layer is out of date if a box was removed or pushed.
+        """
+        if self.session.grid.version != self.grid_version:
+            return True
+        for box, pose in self.baked_boxes.items():
+            if box.body.space is None or box_pose(box) != pose:
+                return True
+        return False
+
+    def dynamic_objects(self):
+        """
+        Returns the objects that are drawn on top of the static layer, in drawing order.
+        """
+        self.session.update_bullet_bodies()
+        for tank in self.session.tanks_list:
+            if tank.spawn_protection:
+                tank.sprite.set_alpha(128)
+            else:
+                tank.sprite.set_alpha(255)
+        return self.session.tanks_list + self.session.bullets_list + self.session.explosion_list + [self.session.flag]
+
+    def draw(self, interpolation=1.0):
+        """
+        Draws one frame and pushes the changed parts of the screen to the display.
+        Moving objects are drawn interpolation of the way from their pose before the
+        last physics step to their current pose.
+        """
+        if self.static_layer_changed():
+            self.bake()
+            self.full_redraw = True
+        if self.full_redraw or gameobjects.DEBUG:
+            self.draw_full(interpolation)
+            return
+
+        current = {}
+        dirty = []
+        for obj in self.dynamic_objects():
+            sprite, rect = obj.screen_sprite(interpolation)
+            current[obj] = (sprite, rect)
+            previous = self.drawn.get(obj)
+            if previous is None or previous[0] is not sprite or previous[1] != rect:
+                dirty.append(rect)
+                if previous is not None:
+                    dirty.append(previous[1])
+        for obj, (sprite, rect) in self.drawn.items():
+            if obj not in current:
+                dirty.append(rect)
+
+        #  Restore the static layer under the dirty rectangles, then draw the
+        #  sprites that touch them, clipped so nothing is blended twice
+        for area in dirty:
+            self.screen.set_clip(area)
+            self.screen.blit(self.static_layer, area, area)
+            for sprite, rect in current.values():
+                if rect.colliderect(area):
+                    self.screen.blit(sprite, rect)
+        self.screen.set_clip(None)
+        self.drawn = current
+        self.session.profiler.lap("render")
+        pygame.display.update(dirty)
+        self.session.profiler.lap("flip")
+
+    def draw_full(self, interpolation=1.0):
+        """
+        Redraws the whole screen.
+        """
+        self.screen.blit(self.static_layer, (0, 0))
+        self.drawn = {}
+        for obj in self.dynamic_objects():
+            sprite, rect = obj.screen_sprite(interpolation)
+            if gameobjects.DEBUG:
+                obj.update_screen(self.screen)  # Also draws the outline of the physics shapes
+            else:
+                self.screen.blit(sprite, rect)
+            self.drawn[obj] = (sprite, rect)
+        self.session.profiler.lap("render")
+        pygame.display.flip()
+        self.session.profiler.lap("flip")
+        self.full_redraw = False
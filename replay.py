@@ -0,0 +1,193 @@
+"""
+Recording and replay of games. The game is deterministic, so a game is kept as
+its settings (map, seed, game mode, physics profile) and the commands of the
+players, each with the physics frame it was given on, instead of a video.
+
+A replay file is a header (magic, version, length of the settings), the
+settings as JSON and then one 6 byte record per command (frame, tank, command).
+The last record is an END command on the frame the game stopped.
+
+Example, replays a game as fast as possible, then at twice its speed on screen:
+    python3 replay.py replays/game-20240101-120000.ctfreplay
+    python3 replay.py replays/game-20240101-120000.ctfreplay --speed 2
+"""
+import argparse
+import json
+import struct
+import time
+import zlib
+
+import pygame
+
+import images
+import maps
+import physics
+import renderer
+import simulation
+import sounds
+
+MAGIC = b'CTFR'
+VERSION = 1
+HEADER = struct.Struct('<4sHI')
+RECORD = struct.Struct('<IBB')
+
+END = 255  # Not a command (see simulation.ACCELERATE, ...), marks the frame the game stopped on
+
+
+def map_checksum(current_map):
+    """
+    Returns a checksum of the tiles of a map, to notice a map that changed since a game was recorded.
+    """
+    return zlib.crc32(current_map.tiles)
+
+
+class Recorder:
+    """
+    Writes the settings and the commands of one game to a replay file.
+    """
+
+    def __init__(self, file):
+        """
+        Takes as argument the file to write. The seed is the one of the session.
+        """
+        self.file = open(file, 'wb')
+
+    def start(self, session):
+        """
+        Writes the settings of a session, called by the session when it is created.
+        """
+        settings = {
+            "map": session.current_map.name,
+            "map_checksum": map_checksum(session.current_map),
+            "session": {
+                "framerate": session.framerate,
+                "all_ai": session.all_ai,
+                "hotspot_multiplayer": session.hotspot_multiplayer,
+                "coop": session.coop,
+                "hard_ai": session.hard_ai,
+                "scores": list(session.scores),
+                "coop_scores": list(session.coop_scores),
+                "ticks": session.ticks,
+                "rounds_fired": session.previous_rounds_fired,
+                "vectorized": session.tank_store is not None,
+                "kinematic_bullets": session.bullet_engine is not None,
+                "ai_budget": session.ai_scheduler.budget,
+                "plan_delay": session.path_planner.delay if session.path_planner is not None else 0,
+                "seed": session.seed,
+            },
+            "physics": session.physics_profile.to_dict(),
+        }
+        data = json.dumps(settings).encode('utf-8')
+        self.file.write(HEADER.pack(MAGIC, VERSION, len(data)))
+        self.file.write(data)
+
+    def record(self, frame, tank_index, command):
+        """
+        Writes a command given to a tank before the physics frame frame.
+        """
+        self.file.write(RECORD.pack(frame, tank_index, command))
+
+    def close(self, frame):
+        """
+        Ends the replay on the frame the game stopped.
+        """
+        self.record(frame, 0, END)
+        self.file.close()
+
+
+def load(file):
+    """
+    Reads a replay file, returns its settings and its records (frame, tank, command).
+    """
+    with open(file, 'rb') as replay_file:
+        data = replay_file.read()
+    magic, version, length = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("%s is not a replay of version %d" % (file, VERSION))
+    settings = json.loads(data[HEADER.size:HEADER.size + length].decode('utf-8'))
+    records = list(RECORD.iter_unpack(data[HEADER.size + length:]))
+    if not records or records[-1][2] != END:
+        raise ValueError("%s was not closed, the game did not end normally" % file)
+    return settings, records
+
+
+def create_session(settings):
+    """
+    Creates the session of a replay, in the state the recorded game started in.
+    """
+    current_map = maps.load_map(settings["map"])
+    if map_checksum(current_map) != settings["map_checksum"]:
+        raise ValueError("the map %s changed since the game was recorded" % settings["map"])
+    return simulation.GameSession(current_map, physics_profile=physics.PhysicsProfile.from_dict(settings["physics"]),
+                                  **settings["session"])
+
+
+def play(session, records, frame_done=None):
+    """
+    Replays the records on a session, frame by frame like rungame runs the game.
+    frame_done, if given, is called after each physics frame.
+    """
+    index = 0
+    end = records[-1][0]
+    while session.frames < end:
+        while records[index][0] == session.frames and records[index][2] != END:
+            if records[index][2] == simulation.NEW_ROUND:
+                session.restore()
+            else:
+                session.command(records[index][1], records[index][2])
+            index += 1
+        if session.frames % simulation.LOGIC_INTERVAL == 0:
+            session.logic_tick()
+        session.physics_step()
+        if frame_done is not None:
+            frame_done()
+
+
+def show(settings, records, speed):
+    """
+    Replays a game on the screen, speed times faster than it was played. Returns the session.
+    """
+    current_map = maps.load_map(settings["map"])
+    pygame.init()
+    screen = pygame.display.set_mode(current_map.rect().size)
+    background = pygame.Surface(screen.get_size())
+    for x in range(current_map.width):
+        for y in range(current_map.height):
+            background.blit(images.grass, (x * images.TILE_SIZE, y * images.TILE_SIZE))
+    session = create_session(settings)
+    game_renderer = renderer.Renderer(screen, background, session)
+    clock = pygame.time.Clock()
+
+    def frame_done():
+        game_renderer.draw()
+        pygame.event.pump()
+        clock.tick(session.framerate * speed)
+
+    play(session, records, frame_done)
+    return session
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded game.")
+    parser.add_argument("file", help="the replay file")
+    parser.add_argument("--speed", type=float, help="show the game on screen, this many times faster than it was played"
+                                                    " (default: replay without display, as fast as possible)")
+    args = parser.parse_args()
+
+    settings, records = load(args.file)
+    start = time.perf_counter()
+    if args.speed is None:
+        sounds.muted = True
+        session = create_session(settings)
+        play(session, records)
+    else:
+        session = show(settings, records, args.speed)
+    elapsed = time.perf_counter() - start
+    print(f"{settings['map']}: {session.frames} frames, {session.ticks} ticks in {elapsed:.2f} s"
+          f" ({session.frames / max(elapsed, 1e-9):.0f} frames/s)")
+    winner = f"tank {session.winner + 1}" if session.winner is not None else "nobody"
+    print(f"Flag captured by {winner}, scores {session.current_scores()}, {session.total_rounds_fired()} rounds fired")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Authoritative multiplayer server. The server runs the only simulation of the
+game at a fixed tick rate, takes the commands of the players over TCP and
+sends every client the entities that changed each tick (see network.py).
+
+Each client that connects takes over a tank from the AI, and gives it back
+when it leaves. Once every tank is taken, clients join as spectators. Rounds
+restart right after a capture and the scores add up for as long as the
+server runs.
+
+Example, serves map0 on port 5000, then connects a player and 30 headless bots:
+    python3 server.py --map map0 --port 5000
+    python3 client.py --port 5000
+    python3 client.py --port 5000 --bots 30
+"""
+import argparse
+import asyncio
+import time
+
+import maps
+import network
+import pathplanner
+import replay
+import simulation
+import sounds
+
+sounds.muted = True  # The server plays no sound, the clients could
+
+MAX_BUFFER = 256 * 1024  # Bytes waiting to be sent to a client before it stops getting snapshots
+MAX_LAG = 1.0  # Seconds the server can fall behind its tick rate before it gives up catching up
+STATS_INTERVAL = 500  # Ticks between two lines of statistics
+
+
+class Client:
+    """
+    A connection to the server.
+    """
+
+    def __init__(self, writer, tank_index):
+        """
+        Takes as argument the stream to write to and the tank of the client (None for a spectator).
+        """
+        self.writer = writer
+        self.tank_index = tank_index
+        self.synced = False  # Whether the client has the last snapshot, if not it gets a full one
+
+
+class Server:
+    """
+    Runs a session and shares it with the clients.
+    """
+
+    def __init__(self, current_map, kinematic_bullets=False):
+        """
+        Takes as argument the map to play on and whether the bullets are kinematic (see bulletengine.py).
+        """
+        self.session = simulation.GameSession(current_map, all_ai=True, kinematic_bullets=kinematic_bullets,
+                                              plan_delay=pathplanner.delay_for(current_map), plan_workers=1)
+        self.interval = simulation.LOGIC_INTERVAL / self.session.framerate  # Seconds per tick
+        self.clients = []
+        self.keys = network.box_keys(self.session)
+        self.states = None  # The entity states of the last snapshot
+        self.bytes_sent = 0
+        self.tick_time = 0.0  # Seconds spent simulating and encoding since the last statistics
+
+    def free_tank(self):
+        """
+        Returns the index of a tank played by the AI, or None if every tank is taken.
+        """
+        taken = {client.tank_index for client in self.clients}
+        for tank_index in range(len(self.session.tanks_list)):
+            if tank_index not in taken:
+                return tank_index
+        return None
+
+    def set_ai_control(self, tank_index, ai_control):
+        """
+        Gives a tank to the AI or takes it from it.
+        """
+        my_ai = self.session.ai_list[tank_index]
+        my_ai.ai_contoll = ai_control
+        my_ai.reset()  # The plan of the AI depends on who controls the tank
+        tank = self.session.tanks_list[tank_index]
+        tank.make_ai(tank.ai, ai_control)  # The speeds and fire rate of a hard AI go with it
+        tank.stop_moving()
+        tank.stop_turning()
+
+    async def handle(self, reader, writer):
+        """
+        Serves one client: sends the hello, then gives its commands to its tank until it leaves.
+        """
+        tank_index = self.free_tank()
+        if tank_index is not None:
+            self.set_ai_control(tank_index, False)
+        client = Client(writer, tank_index)
+        self.clients.append(client)
+        current_map = self.session.current_map
+        writer.write(network.encode({"map": current_map.name, "map_checksum": replay.map_checksum(current_map),
+                                     "tank": tank_index, "tick_rate": 1 / self.interval}))
+        try:
+            while True:
+                command, = network.COMMAND.unpack(await reader.readexactly(network.COMMAND.size))
+                if client.tank_index is not None and command in network.PLAYER_COMMANDS:
+                    self.session.command(client.tank_index, command)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # The client left
+        finally:
+            self.clients.remove(client)
+            if tank_index is not None:
+                self.set_ai_control(tank_index, True)
+            writer.close()
+
+    def tick(self):
+        """
+        Runs one tick of the game and sends the snapshot to the clients.
+        """
+        start = time.perf_counter()
+        session = self.session
+        if session.winner is not None:
+            session.restore()  # The flag was captured on the last tick, the next round starts right away
+        session.step(1)
+        states = network.entity_states(session, self.keys)
+        delta = network.snapshot(session.ticks, self.states, states)
+        full = None
+        for client in self.clients:
+            if client.writer.transport.get_write_buffer_size() > MAX_BUFFER:
+                #  The client does not keep up, it skips snapshots and gets a full one once it caught up
+                client.synced = False
+                continue
+            if client.synced:
+                message = delta
+            else:
+                if full is None:
+                    full = network.snapshot(session.ticks, None, states)
+                message = full
+                client.synced = True
+            client.writer.write(message)
+            self.bytes_sent += len(message)
+        self.states = states
+        self.tick_time += time.perf_counter() - start
+
+    def print_stats(self):
+        """
+        Prints the number of clients, the time per tick and the bandwidth since the last call.
+        """
+        seconds = STATS_INTERVAL * self.interval
+        print(f"tick {self.session.ticks}: {len(self.clients)} clients, {self.tick_time / STATS_INTERVAL * 1000:.2f} ms"
+              f" per tick ({self.tick_time / seconds:.0%} of the time), {self.bytes_sent / seconds / 1024:.1f} KiB/s sent,"
+              f" scores {self.session.current_scores()}")
+        self.bytes_sent = 0
+        self.tick_time = 0.0
+
+    async def run(self, host, port, max_ticks=None):
+        """
+        Serves clients on host:port and runs the game at its tick rate, for max_ticks ticks or forever.
+        """
+        server = await asyncio.start_server(self.handle, host, port)
+        print("Serving %s on %s:%d" % (self.session.current_map.name, host, server.sockets[0].getsockname()[1]))
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        async with server:
+            while max_ticks is None or self.session.ticks < max_ticks:
+                self.tick()
+                if self.session.ticks % STATS_INTERVAL == 0:
+                    self.print_stats()
+                next_tick += self.interval
+                delay = next_tick - loop.time()
+                if delay < -MAX_LAG:
+                    next_tick = loop.time()  # Too far behind, the ticks that were missed are dropped
+                await asyncio.sleep(max(delay, 0))
+            for client in self.clients:
+                client.writer.close()
+        self.session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a multiplayer game.")
+    parser.add_argument("--map", default="map0", help="name of the map in maps/")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=5000, help="port to listen on (0 picks a free one)")
+    parser.add_argument("--ticks", type=int, help="stop after this many ticks (default: run forever)")
+    parser.add_argument("--kinematic-bullets", action="store_true",
+                        help="move the bullets with the NumPy engine instead of pymunk")
+    args = parser.parse_args()
+
+    server = Server(maps.load_map(args.map), args.kinematic_bullets)
+    try:
+        asyncio.run(server.run(args.host, args.port, args.ticks))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,594 @@
+"""
+Headless simulation core of the game. A GameSession owns its own physics
+space, game objects and AIs and can be stepped without display, audio or clock.
+"""
+import math
+import random
+import time
+import pymunk
+
+import ai
+import aischeduler
+import images
+import gameobjects
+import lineofsight
+import maps
+import pathfinding
+import pathplanner
+import physics
+import profiling
+import sounds
+import visibility
+import bulletengine
+import tankstore
+
+#  Constants
+FRAMERATE = 50
+LOGIC_INTERVAL = 3  # Game logic runs once every LOGIC_INTERVAL physics frames
+TIME_LIMIT = 2500  # Number of ticks before the time limit is reached
+ROUNDS_LIMIT = 250  # Number of rounds fired before the rounds fired limit is reached
+BEST_OF = 5  # Number of captures in a best of five
+START_JITTER = 10  # Ticks an AI of a seeded session may wait at most before it starts a round
+TEAMS = ["Team one", "Team two", "Team three"]
+
+#  The commands a player can give to a tank, see GameSession.command
+ACCELERATE = 0
+DECELERATE = 1
+TURN_LEFT = 2
+TURN_RIGHT = 3
+SHOOT = 4
+STOP_MOVING = 5
+STOP_TURNING = 6
+NEW_ROUND = 7  # Not a tank command, marks in a replay that the round was restarted
+
+
+class GameSession:
+    """
+    One match on one map. Holds everything that rungame used to keep in
+    module level variables (space, game objects, tanks, bullets, AIs and ticks).
+    """
+
+    def __init__(self, current_map, framerate=FRAMERATE, all_ai=True, hotspot_multiplayer=False,
+                 coop=False, hard_ai=False, scores=None, coop_scores=None, ticks=0, rounds_fired=0, vectorized=False,
+                 kinematic_bullets=False, physics_profile=None, profiler=None,
+                 recorder=None, ai_budget=aischeduler.BUDGET, plan_delay=0, plan_workers=0, seed=None):
+        """
+        Takes as argument the map to play on, the framerate of the physics and the
+        game mode settings. Scores can be shared with the caller by passing the lists,
+        and ticks and rounds_fired carry the counters over from the previous rounds of a match.
+        With vectorized the tanks keep their state in the arrays of a tankstore.TankStore and
+        are updated in one NumPy pass, and with kinematic_bullets the bullets are moved by a
+        bulletengine.BulletEngine instead of pymunk (both need NumPy). physics_profile sets up the pymunk space, by default the
+        profile locked for the map (see physics.profile_for). A profiling.Profiler passed as
+        profiler measures the phases of every tick, and a replay.Recorder passed as recorder
+        writes the settings and the player commands to a replay file. ai_budget is the
+        path finding work the AIs may do in one tick (see aischeduler.py). With plan_delay
+        the AIs get new distance fields plan_delay ticks after asking for them, searched by
+        plan_workers worker processes (see pathplanner.py); call close when done. With a
+        seed, each AI waits a few ticks drawn from it before it starts a round, so
+        matches with different seeds play differently (the game uses no other randomness).
+        """
+        self.current_map = current_map
+        self.framerate = framerate
+        self.all_ai = all_ai
+        self.hotspot_multiplayer = hotspot_multiplayer
+        self.coop = coop
+        self.scores = scores if scores is not None else [0] * 6
+        self.coop_scores = coop_scores if coop_scores is not None else [0] * 3
+        self.hard_ai = hard_ai
+        gameobjects.hard_ai = hard_ai
+        self.seed = seed
+        self.random = random.Random(seed) if seed is not None else None
+
+        self.physics_profile = physics_profile or physics.profile_for(current_map)
+        self.profiler = profiler or profiling.NULL_PROFILER
+
+        #  List of all game objects
+        self.game_objects_list = []
+        self.tanks_list = []
+        self.bullets_list = []
+        self.ai_list = []
+        self.explosion_list = []
+        self.flag = None
+        self.wall = None  # The merged collision shapes of the rock boxes
+        self.ticks = ticks
+        self.previous_rounds_fired = rounds_fired
+        self.frames = 0
+        self.winner = None  # Index of the tank that captured the flag this round
+        self.teleported = []  # Bodies moved by hand during the physics frame, see physics_step
+        self.interpolate = False  # Save the poses before each physics step, for a display that interpolates
+        self.grid = maps.OccupancyGrid(current_map)  # Live layout of the boxes
+        self.flow_fields = pathfinding.FlowFields(self.grid)  # Path finding shared by all AIs
+        self.line_of_sight = None  # Raycasts shared by all AIs, created once the space is ready
+        self.bullet_pool = gameobjects.Pool(gameobjects.Bullet)
+        self.explosion_pool = gameobjects.Pool(gameobjects.Explosion)
+        self.tank_store = tankstore.TankStore(framerate) if vectorized else None
+        self.bullet_engine = bulletengine.BulletEngine(self) if kinematic_bullets else None
+
+        self.create_space()
+        self.line_of_sight = lineofsight.LineOfSight(self.space, self.tanks_list, self.grid, self.bullets_list)
+        self.visibility = visibility.Visibility(current_map, self.grid, self.tanks_list)  # Rays not worth casting
+        self.generate_map()
+        self.path_planner = pathplanner.PathPlanner(self.flow_fields, plan_delay, plan_workers) if plan_delay else None
+        self.ai_scheduler = aischeduler.AiScheduler(self.ai_list, self.flow_fields, ai_budget, self.path_planner)
+        for my_ai in self.ai_list:
+            self.ai_scheduler.add(my_ai)
+        self.draw_start_delays()
+        self.saved = None
+        self.snapshot()
+        self.recorder = recorder
+        if recorder is not None:
+            recorder.start(self)
+
+    #  ----- Map Generator -----#
+
+    def create_space(self):
+        """
+        Initialises the physics engine: creates the space with the parts of the map
+        that never change, the border and the rock walls.
+        """
+        self.space = pymunk.Space()
+        self.space.gravity = (0.0, 0.0)
+        self.space.damping = 0.1  # Adds friction to the ground for all objects
+        self.physics_profile.apply(self.space, self.current_map)
+        self.add_collision_handlers()
+        self.spawn_border()
+        self.wall = gameobjects.RockWall(self.current_map.rock_rectangles(), self.space)
+
+    def generate_map(self):
+        """
+        Generates all game objects of the map, the space holds the border and the walls already
+        """
+        self.spawn_boxes()
+        self.spawn_tanks()
+        self.spawn_flag()
+
+    def spawn_border(self):
+        """
+        Spawns a border around the map
+        """
+        space = self.space
+        width = self.current_map.width
+        height = self.current_map.height
+        thickness = 0
+        static_lines = [
+            pymunk.Segment(space.static_body, (0, 0), (width, 0), thickness),  # Top border
+            pymunk.Segment(space.static_body, (0, 0), (0, height), thickness),  # Left border
+            pymunk.Segment(space.static_body, (0, height), (width, height), thickness),  # Bottom border
+            pymunk.Segment(space.static_body, (width, 0), (width, height), thickness)  # Right border
+        ]
+        for line in static_lines:
+            line.elasticity = 1
+            line.friction = 0.5
+            line.collision_type = gameobjects.BORDER_COLLISION_TYPE
+            space.add(line)
+
+    def spawn_boxes(self):
+        """
+        Spawns boxes. The rock boxes never move, so they share a few merged
+        collision rectangles (see gameobjects.RockWall and create_space) and are only sprites.
+        """
+        for width in range(0, self.current_map.width):
+            for height in range(0, self.current_map.height):
+                box_type = self.current_map.boxAt(width, height)
+                if box_type == 1:
+                    self.game_objects_list.append(gameobjects.GameVisibleObject(width + 0.5, height + 0.5, images.rockbox))
+                #  If the box type is not 0 (aka grass tile), create a box
+                elif box_type != 0:
+                    box = gameobjects.get_box_with_type(width, height, box_type, self.space)
+                    self.game_objects_list.append(box)
+                    if box.body.body_type == pymunk.Body.DYNAMIC:
+                        self.grid.track(box, box_type)
+
+    def spawn_tanks(self):
+        """
+        Spawns tanks and assignes teams and AI
+        """
+        if self.all_ai:
+            ai_contoll = [True, True, True, True, True, True]
+        elif self.hotspot_multiplayer:
+            ai_contoll = [False, False, True, True, True, True]
+        else:  # singleplayer
+            ai_contoll = [False, True, True, True, True, True]
+        for tank_index in range(0, len(self.current_map.start_positions)):
+            pos = self.current_map.start_positions[tank_index]
+            if self.tank_store is not None:
+                tank = self.tank_store.create(pos[0], pos[1], pos[2], images.tanks[tank_index], self.space)
+            else:
+                tank = gameobjects.Tank(pos[0], pos[1], pos[2], images.tanks[tank_index], self.space)
+            tank.bullet_pool = self.bullet_pool
+            tank.bullet_engine = self.bullet_engine
+            self.tanks_list.append(tank)
+            #  Add bases
+            base = gameobjects.GameVisibleObject(pos[0], pos[1], images.bases[tank_index])
+            self.game_objects_list.append(base)
+            #  Add ai to tanks
+            my_ai = ai.Ai(tank, self.game_objects_list, self.tanks_list, self.bullets_list, self.space,
+                          self.current_map, self.framerate, self.coop, ai_contoll[tank_index], self.flow_fields, self.line_of_sight,
+                          self.visibility)
+            self.ai_list.append(my_ai)
+            if self.coop:
+                tank.team = TEAMS[tank_index // 2]
+
+    def spawn_flag(self):
+        """
+        Spawns the flag
+        """
+        self.flag = gameobjects.Flag(self.current_map.flag_position[0], self.current_map.flag_position[1])
+        self.game_objects_list.append(self.flag)
+
+    def draw_start_delays(self):
+        """
+        Gives each AI the number of ticks it waits before it starts the round,
+        drawn from the seed of the session. Without a seed the AIs start at once.
+        """
+        if self.random is None:
+            return
+        for my_ai in self.ai_list:
+            my_ai.start_delay = self.random.randrange(START_JITTER + 1)
+
+    #  ----- Snapshot -----#
+
+    def snapshot(self):
+        """
+        Saves the state of the world, restore puts it back. Called once the map is spawned.
+        The walls and the border never change, so they are not saved.
+        """
+        self.saved = {
+            "objects": list(self.game_objects_list),
+            "bodies": [(body, body.position, body.angle) for body in self.space.bodies
+                       if body.body_type == pymunk.Body.DYNAMIC],
+            "tanks": [dict(vars(tank)) for tank in self.tanks_list],
+            "tank_store": self.tank_store.snapshot() if self.tank_store is not None else None,
+            "flag": dict(vars(self.flag)),
+            "cells": bytes(self.grid.cells),
+            "box_tiles": dict(self.grid.box_tiles),
+        }
+
+    def restore(self):
+        """
+        Puts the world back as it was at the snapshot, for a new round: bullets and
+        explosions are removed, destroyed boxes are put back and every tank, box, the
+        flag and the AIs start again. Only the space, with its border and rock walls, is
+        created again, the game objects are reused.
+        The scores, ticks and rounds fired of the match are kept.
+        """
+        if self.recorder is not None:
+            self.recorder.record(self.frames, 0, NEW_ROUND)
+        self.previous_rounds_fired = self.total_rounds_fired()
+        for bullet in self.bullets_list[:]:
+            self.remove_bullet(bullet)
+        for explosion in self.explosion_list:
+            self.explosion_pool.release(explosion)
+        self.explosion_list.clear()
+
+        #  The space is made again and the bodies are put back in the order they were
+        #  created, destroyed boxes included. pymunk numbers the shapes in the order
+        #  they are added and the contacts are solved in an order that depends on it,
+        #  so the round plays like the first one of a new session.
+        for body, position, angle in self.saved["bodies"]:
+            if body.space is not None:
+                self.space.remove(body, *body.shapes)
+        self.create_space()
+        for body, position, angle in self.saved["bodies"]:
+            body.position = position
+            body.angle = angle
+            body.velocity = (0, 0)
+            body.angular_velocity = 0
+            body.force = (0, 0)
+            body.torque = 0
+            self.space.add(body, *body.shapes)
+        self.teleported.clear()
+        self.line_of_sight.space = self.space
+        for my_ai in self.ai_list:
+            my_ai.space = self.space
+        self.game_objects_list[:] = self.saved["objects"]  # The same list, the AIs keep it
+
+        for tank, saved in zip(self.tanks_list, self.saved["tanks"]):
+            vars(tank).update(saved)
+        if self.tank_store is not None:
+            self.tank_store.restore(self.saved["tank_store"])
+        vars(self.flag).update(self.saved["flag"])
+
+        #  The grid is changed tile by tile, so the path finding can repair its fields
+        cells = self.saved["cells"]
+        for index in range(len(cells)):
+            if self.grid.cells[index] != cells[index]:
+                self.grid.set_box(index % self.grid.width, index // self.grid.width, cells[index])
+        self.grid.box_tiles = dict(self.saved["box_tiles"])
+        self.grid.tile_boxes = {tile: box for box, tile in self.grid.box_tiles.items()}
+
+        for my_ai in self.ai_list:
+            my_ai.reset()
+            my_ai.tank.make_ai(my_ai, my_ai.ai_contoll)  # A server may have changed who controls it
+        self.draw_start_delays()
+        if self.bullet_engine is not None:
+            self.bullet_engine.boxes = None
+            self.bullet_engine.scenery = None
+        self.winner = None
+
+    #  ----- Collision Logic -----#
+
+    def add_collision_handlers(self):
+        """
+        Registers the bullet collision handlers on the space of the session
+        """
+        handler = self.space.add_collision_handler(gameobjects.BOX_COLLISION_TYPE, gameobjects.BULLET_COLLISION_TYPE)
+        handler.pre_solve = self.collision_bullets_boxes
+        handler = self.space.add_collision_handler(gameobjects.TANK_COLLISION_TYPE, gameobjects.BULLET_COLLISION_TYPE)
+        handler.pre_solve = self.collision_bullets_tanks
+        handler = self.space.add_collision_handler(gameobjects.BULLET_COLLISION_TYPE, gameobjects.BORDER_COLLISION_TYPE)
+        handler.pre_solve = self.collision_bullets_walls
+
+    def collision_bullets_tanks(self, arbiter, space, data):
+        """
+        Collision handler for bullets with tanks
+        """
+        start = time.perf_counter()
+        tank, bullet = arbiter.shapes[0].parent, arbiter.shapes[1].parent
+        self.bullet_hit_tank(bullet, tank)
+        self.profiler.add("collisions", time.perf_counter() - start)
+        return False
+
+    def bullet_hit_tank(self, bullet, tank):
+        """
+        A bullet hit a tank, the tank loses a hit point or is destroyed
+        """
+        sounds.play_sound(sounds.small_explosion_sound)
+        self.remove_bullet(bullet)
+        if tank.spawn_protection is False:
+            if tank.hp > 1:
+                tank.hp -= 1
+            else:
+                self.reset_tank(tank)
+
+    def collision_bullets_boxes(self, arbiter, space, data):
+        """
+        Collision handler for bullets with boxes
+        """
+        start = time.perf_counter()
+        box, bullet = arbiter.shapes[0].parent, arbiter.shapes[1].parent
+        self.bullet_hit_box(bullet, box)
+        self.profiler.add("collisions", time.perf_counter() - start)
+        return False  # This changes if boxes moves after hit
+
+    def bullet_hit_box(self, bullet, box):
+        """
+        A bullet hit a box, a wooden box is destroyed
+        """
+        sounds.play_sound(sounds.small_explosion_sound)
+        self.remove_bullet(bullet)
+        if box.destructable:
+            self.remove_box(box)
+
+    def collision_bullets_walls(self, arbiter, space, data):
+        """
+        Collision handler for bullets with wall
+        """
+        start = time.perf_counter()
+        bullet = arbiter.shapes[0].parent
+        self.bullet_hit_wall(bullet)
+        self.profiler.add("collisions", time.perf_counter() - start)
+        return True
+
+    def bullet_hit_wall(self, bullet):
+        """
+        A bullet hit the border of the map
+        """
+        sounds.play_sound(sounds.small_explosion_sound)
+        self.remove_bullet(bullet)
+
+    def reset_tank(self, tank):
+        """
+        Reset the tank to its starting position and rotation
+        """
+        sounds.play_sound(sounds.tank_destroyed_sound)
+        if tank.flag:
+            self.drop_flag(tank)
+        tank.body.position = tank.start_position
+        tank.body.angle = tank.start_orientation
+        self.teleported.append(tank.body)
+        tank.hp = gameobjects.Tank.HP
+        tank.stoped = True
+        tank.spawn_protection = True
+        tank.spawn_protection_timer = 0
+
+    def drop_flag(self, tank):
+        """
+        Drop the flag from the tank
+        """
+        sounds.play_sound(sounds.flag_dropped_sound)
+        self.flag.is_on_tank = False
+        tank.flag = None
+
+    def remove_bullet(self, bullet):
+        """
+        Remove the bullet from the game
+        """
+        if bullet in self.bullets_list:
+            position = bullet.shape.body.position
+            self.explosion_list.append(self.explosion_pool.acquire(position.x, position.y))
+            bullet.body.space.remove(bullet.shape, bullet.body)  # The space of the bullet engine if there is one
+            self.bullets_list.remove(bullet)
+            if self.bullet_engine is not None:
+                self.bullet_engine.remove(bullet)
+            self.bullet_pool.release(bullet)
+
+    def remove_box(self, box):
+        """
+        Remove the box from the game
+        """
+        if box in self.game_objects_list:
+            sounds.play_sound(sounds.box_destroyed_sound)
+            self.space.remove(box.shape, box.shape.body)
+            self.game_objects_list.remove(box)
+            self.grid.remove(box)
+
+    #  ----- Player commands -----#
+
+    def command(self, tank_index, command):
+        """
+        Gives a command (ACCELERATE, SHOOT, ...) to a tank. It takes effect from the
+        next physics frame, and is written to the replay if the game is recorded.
+        """
+        if self.recorder is not None:
+            self.recorder.record(self.frames, tank_index, command)
+        tank = self.tanks_list[tank_index]
+        if command == ACCELERATE:
+            tank.accelerate()
+        elif command == DECELERATE:
+            tank.decelerate()
+        elif command == TURN_LEFT:
+            tank.turn_left()
+        elif command == TURN_RIGHT:
+            tank.turn_right()
+        elif command == SHOOT:
+            tank.shoot(self.bullets_list, self.space, self.framerate)
+        elif command == STOP_MOVING:
+            tank.stop_moving()
+        elif command == STOP_TURNING:
+            tank.stop_turning()
+        else:
+            raise ValueError("unknown command %d" % command)
+
+    #  ----- Simulation -----#
+
+    def logic_tick(self):
+        """
+        Updates the game logic once: win check, tanks, bullets, AIs and explosions.
+        """
+        #  Boxes pushed since the last tick, the AIs only look at the grid here
+        self.grid.update_boxes()
+        for tank_index in range(0, len(self.tanks_list)):
+            if self.winner is None and self.tanks_list[tank_index].has_won():
+                self.winner = tank_index
+                self.update_scores(tank_index)
+
+        for obj in self.game_objects_list:
+            obj.update()
+        self.profiler.lap("rules")
+        if self.tank_store is not None:
+            self.tank_store.update()
+        else:
+            for tank in self.tanks_list:
+                tank.update(self.framerate)
+        self.profiler.lap("tanks")
+        if self.bullet_engine is not None:
+            self.bullet_engine.update()
+        else:
+            for bullet in self.bullets_list:
+                bullet.update()
+        self.profiler.lap("bullets")
+        self.line_of_sight.begin_tick()
+        self.visibility.begin_tick()
+        self.ai_scheduler.run(self.ticks)
+        self.profiler.lap("ai")
+        for explosion in self.explosion_list[:]:
+            if explosion.update():
+                self.explosion_list.remove(explosion)
+                self.explosion_pool.release(explosion)
+        self.ticks += 1
+        self.profiler.lap("explosions")
+
+    def physics_step(self):
+        """
+        Steps the physics one frame and updates objects that depend on an other
+        object position (for instance a flag).
+        """
+        if self.interpolate:
+            for obj in self.tanks_list + self.bullets_list + [self.flag]:
+                obj.save_pose()
+            self.profiler.lap("interpolation")
+        self.space.step(1 / self.framerate)
+        self.profiler.lap("space_step")
+        if self.bullet_engine is not None:
+            self.bullet_engine.step(1 / self.framerate)
+            self.profiler.lap("bullet_engine")
+        #  pymunk only moves the shapes of a body moved by hand at the next step, a ray
+        #  cast before it would still see them where they were
+        for body in self.teleported:
+            self.space.reindex_shapes_for_body(body)
+        self.teleported.clear()
+        for obj in self.game_objects_list:
+            obj.post_update()
+        for tank in self.tanks_list:
+            tank.try_grab_flag(self.flag)
+            tank.post_update()
+        self.frames += 1
+        self.profiler.lap("post_update")
+
+    def step(self, n_ticks=1):
+        """
+        Runs n_ticks ticks of the game, each one being a logic update followed by
+        LOGIC_INTERVAL physics frames. Stops early when a tank captures the flag.
+        Returns the number of ticks that were run.
+        """
+        for tick in range(n_ticks):
+            if self.winner is not None:
+                return tick
+            self.profiler.start_frame()
+            self.logic_tick()
+            for frame in range(LOGIC_INTERVAL):
+                self.physics_step()
+            self.profiler.end_frame()
+        return n_ticks
+
+    def update_bullet_bodies(self):
+        """
+        Puts the bodies of the bullets moved by the bullet engine where the bullets
+        are, before they are read (drawn or sent). Without the engine they already are.
+        """
+        if self.bullet_engine is not None:
+            self.bullet_engine.sync()
+
+    def close(self):
+        """
+        Stops the workers of the path planner, if the session has one.
+        """
+        if self.path_planner is not None:
+            self.path_planner.close()
+
+    #  ----- Scores -----#
+
+    def update_scores(self, winner_index):
+        """
+        Update the scores of the winner
+        """
+        if self.coop:
+            self.coop_scores[math.ceil(winner_index / 2)] += 1
+        else:
+            self.scores[winner_index] += 1
+
+    def total_rounds_fired(self):
+        """
+        Returns how many rounds have been fired in the match so far
+        """
+        return self.previous_rounds_fired + sum(tank.rounds_fired for tank in self.tanks_list)
+
+    def current_scores(self):
+        """
+        Returns the scores that the win conditions are computed on
+        """
+        if self.coop:
+            return self.coop_scores
+        return self.scores
+
+    def leaders(self):
+        """
+        Returns the 1-based indices of the players or teams with the highest score
+        """
+        scores = self.current_scores()
+        max_score = max(scores)
+        return [index + 1 for index, score in enumerate(scores) if score == max_score]
+
+    def match_over(self, condition):
+        """
+        Checks if the win condition of the match is reached, without displaying anything
+        """
+        if condition == "best_of_5":
+            return sum(self.current_scores()) >= BEST_OF
+        if condition == "time_limit":
+            return self.ticks >= TIME_LIMIT
+        if condition == "rounds_fired":
+            return self.total_rounds_fired() >= ROUNDS_LIMIT
+        return False
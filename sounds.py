@@ -1,44 +1,170 @@
+""" Sounds of the game
+
+The sounds are loaded the first time they are used (sounds.bullet_sound loads
+bullet.wav) with their volume already set. play_sound only queues a sound: the
+queue is played by flush, once per frame outside of the physics step, on a
+fixed pool of mixer channels, and a sound is not played again within
+THROTTLE_TIME. Without audio the sounds go to a mixer that does nothing.
+"""
+import math
 import os
+import time
+
 import pygame
 
 main_dir = os.path.split(os.path.abspath(__file__))[0]
 
+muted = False  # Set to True to silence every sound, for instance in headless simulations
 
-def load_sound(file):
-    """ Load a sound from the sounds directory. """
-    file = os.path.join(main_dir, 'data', 'audio', file)
-    try:
-        sound = pygame.mixer.Sound(file)
-    except pygame.error:
-        raise SystemExit('Could not load sound "%s" %s' % (file, pygame.get_error()))
-    return sound
-
+CHANNELS = 8  # Number of mixer channels the sounds are played on
+THROTTLE_TIME = 0.05  # Seconds during which a sound that was just played is not played again
 
-small_explosion_sound = load_sound('small_explosion.wav')  # Pskott som träffar plåt
 
-bullet_sound = load_sound('bullet.wav')  # pansarskott från S122
+class SilentSound:
+    """ Stand-in for a sound that could not be loaded, it plays nothing (the null audio backend). """
 
-tank_destroyed_sound = load_sound('tank_destroyed.wav')  # jävla smäll
+    def set_volume(self, volume):
+        return
 
-box_destroyed_sound = load_sound('box_destroyed.wav')  # kaplastavar
+    def play(self):
+        return
 
-flag_captured_sound = load_sound('flag_captured.wav')  # Halo3 ljud
+    def stop(self):
+        return
 
-flag_dropped_sound = load_sound('flag_dropped.wav')  # Halo3 ljud
 
-movement_sound = load_sound('movement.wav')  # bv410 som kör agresivt
+def load_sound(file, volume):
+    """ Load a sound from the sounds directory and set its volume. """
+    file = os.path.join(main_dir, 'data', 'audio', file)
+    if muted or not pygame.mixer.get_init() or not os.path.exists(file):
+        #  Muted, no audio device (headless) or the file is not shipped
+        return SilentSound()
+    try:
+        sound = pygame.mixer.Sound(file)
+    except pygame.error:
+        raise SystemExit('Could not load sound "%s" %s' % (file, pygame.get_error()))
+    sound.set_volume(volume)
+    return sound
 
-idle_engine_sound = load_sound('idle_engine.wav')  # bv410 som kör lungt
 
-win_sound = load_sound('win.wav')  # Meme ljud
+#  The file and the volume of each sound, it is loaded the first time it is used
+SOUNDS = {
+    'small_explosion_sound': ('small_explosion.wav', 0.7),  # Pskott som träffar plåt
+    'bullet_sound': ('bullet.wav', 0.2),  # pansarskott från S122
+    'tank_destroyed_sound': ('tank_destroyed.wav', 0.2),  # jävla smäll
+    'box_destroyed_sound': ('box_destroyed.wav', 0.2),  # kaplastavar
+    'flag_captured_sound': ('flag_captured.wav', 0.2),  # Halo3 ljud
+    'flag_dropped_sound': ('flag_dropped.wav', 0.2),  # Halo3 ljud
+    'movement_sound': ('movement.wav', 0.2),  # bv410 som kör agresivt
+    'idle_engine_sound': ('idle_engine.wav', 1),  # bv410 som kör lungt
+    'win_sound': ('win.wav', 1),  # Meme ljud
+}
+
+
+def __getattr__(name):
+    """ Loads a sound of SOUNDS the first time it is used, it is then kept in the module. """
+    if name not in SOUNDS:
+        raise AttributeError("module 'sounds' has no attribute '%s'" % name)
+    sound = load_sound(*SOUNDS[name])
+    globals()[name] = sound
+    return sound
 
 
-def play_sound(sound, volume=0.2):
-    """ Play a sound. """
-    sound.set_volume(volume)
-    sound.play()
+class AudioMixer:
+    """
+    Owns the mixer channels and plays the queued sounds on them.
+    """
+
+    def __init__(self, channels=CHANNELS, throttle_time=THROTTLE_TIME):
+        """
+        Takes as argument the number of channels and the time during which a sound is not played again.
+        """
+        pygame.mixer.set_num_channels(channels)
+        self.channels = [pygame.mixer.Channel(index) for index in range(channels)]
+        self.started = [-math.inf] * channels  # When the sound of each channel started
+        self.throttle_time = throttle_time
+        self.queue = {}  # The sounds to play at the next flush, a sound queued twice is played once
+        self.last_played = {}  # When each sound was last played
+
+    def play(self, sound):
+        """
+        Queues a sound, it is played at the next flush.
+        """
+        self.queue[sound] = None
+
+    def stop(self, sound):
+        """
+        Stops a sound, and drops it from the queue.
+        """
+        self.queue.pop(sound, None)
+        sound.stop()
+
+    def flush(self):
+        """
+        Plays the queued sounds, except those played less than throttle_time ago.
+        """
+        if not self.queue:
+            return
+        now = time.perf_counter()
+        for sound in self.queue:
+            if isinstance(sound, SilentSound) or now - self.last_played.get(sound, -math.inf) < self.throttle_time:
+                continue
+            self.last_played[sound] = now
+            index = self.free_channel()
+            self.channels[index].play(sound)
+            self.started[index] = now
+        self.queue.clear()
+
+    def free_channel(self):
+        """
+        Returns the index of a channel that plays nothing, or else of the one that has played the longest.
+        """
+        for index, channel in enumerate(self.channels):
+            if not channel.get_busy():
+                return index
+        return self.started.index(min(self.started))
+
+
+class NullMixer:
+    """
+    Used when there is no audio (muted or no mixer), every method does nothing.
+    """
+
+    def play(self, sound):
+        return
+
+    def stop(self, sound):
+        return
+
+    def flush(self):
+        return
+
+
+NULL_MIXER = NullMixer()
+
+mixer = None  # The AudioMixer, created the first time a sound is played with audio
+
+
+def get_mixer():
+    """ Returns the mixer sounds are played on, NULL_MIXER if there is no audio. """
+    global mixer
+    if muted or not pygame.mixer.get_init():
+        return NULL_MIXER
+    if mixer is None:
+        mixer = AudioMixer()
+    return mixer
+
+
+def play_sound(sound):
+    """ Queue a sound, it is played at the next flush. """
+    get_mixer().play(sound)
 
 
 def stop_sound(sound):
     """ Stop a sound. """
-    sound.stop()
+    get_mixer().stop(sound)
+
+
+def flush():
+    """ Play the queued sounds, called once per frame. """
+    get_mixer().flush()
@@ -0,0 +1,176 @@
+"""
+Optional array-backed tanks. A TankStore keeps the state of the tanks of a game
+in NumPy arrays, one entry per tank: the commands (acceleration, rotation), the
+speeds, the timers, the hit points and the spawn protection flag. The tanks it
+creates are StoredTank objects, which read and write these attributes in the
+arrays, so the arrays are the only copy and the commands, the AIs and the rules
+of the game change them in place. Needs NumPy, which is not a requirement of the game.
+
+Once per tick TankStore.update runs Tank.update for every tank in one
+vectorized pass. The velocities and the angles belong to the pymunk bodies,
+which the physics step changes, so they are the only values read from the
+bodies before the pass and the velocities the only ones written back.
+pymunk 6 has no call that reads or writes many bodies at once, so these two
+loops over the bodies are what is left of the cost per tank.
+"""
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import gameobjects
+
+#  Attributes of the tanks that are kept in the arrays, with the type of their array
+COLUMNS = {
+    "acceleration": int,
+    "rotation": int,
+    "base_acceleration": float,
+    "max_speed": float,
+    "shoot_last": int,
+    "spawn_protection_timer": int,
+    "spawn_protection": bool,
+    "hp": int,
+}
+
+
+class Column:
+    """
+    An attribute of StoredTank that is an entry of an array of its TankStore.
+    """
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, tank, owner):
+        if tank is None:
+            return self
+        #  item gives a Python number, as the attribute of a Tank would be
+        return getattr(tank.store, self.name).item(tank.index)
+
+    def __set__(self, tank, value):
+        getattr(tank.store, self.name)[tank.index] = value
+
+
+class StoredTank(gameobjects.Tank):
+    """
+    A tank whose state is kept in a TankStore, created by TankStore.create.
+    """
+
+    acceleration = Column()
+    rotation = Column()
+    base_acceleration = Column()
+    max_speed = Column()
+    shoot_last = Column()
+    spawn_protection_timer = Column()
+    spawn_protection = Column()
+    hp = Column()
+
+    def __init__(self, store, index, x, y, orientation, sprite, space):
+        """
+        Takes as argument the store, the entry of the tank in its arrays and the
+        arguments of a Tank.
+        """
+        self.store = store
+        self.index = index
+        super().__init__(x, y, orientation, sprite, space)
+
+
+class TankStore:
+    """
+    Holds the state of the tanks of a game as arrays, one entry per tank.
+    """
+
+    def __init__(self, framerate):
+        """
+        Takes as argument the framerate of the game.
+        """
+        if numpy is None:
+            raise ImportError("TankStore needs numpy, install it with 'pip install numpy'")
+        self.framerate = framerate
+        #  Every tank has the same spawn protection, see Tank.update
+        self.protection_time = framerate // (gameobjects.Tank.PROTECTION * 3)
+        self.bodies = []
+        for name, kind in COLUMNS.items():
+            setattr(self, name, numpy.zeros(0, dtype=kind))
+        #  The state of the bodies during update
+        self.velocity = numpy.zeros((0, 2))
+        self.angle = numpy.zeros(0)
+        self.angular_velocity = numpy.zeros(0)
+
+    def create(self, x, y, orientation, sprite, space):
+        """
+        Creates a tank kept in the store, takes the arguments of a Tank.
+        """
+        index = len(self.bodies)
+        for name in COLUMNS:
+            setattr(self, name, numpy.append(getattr(self, name), numpy.zeros(1, dtype=COLUMNS[name])))
+        self.velocity = numpy.zeros((index + 1, 2))
+        self.angle = numpy.zeros(index + 1)
+        self.angular_velocity = numpy.zeros(index + 1)
+        tank = StoredTank(self, index, x, y, orientation, sprite, space)
+        self.bodies.append(tank.body)
+        return tank
+
+    def snapshot(self):
+        """
+        Returns a copy of the arrays, restore puts them back.
+        """
+        return {name: getattr(self, name).copy() for name in COLUMNS}
+
+    def restore(self, saved):
+        """
+        Puts back the arrays copied by snapshot.
+        """
+        for name in COLUMNS:
+            getattr(self, name)[:] = saved[name]
+
+    def read_bodies(self):
+        """
+        Copies the velocities and the angles of the bodies into the arrays.
+        """
+        bodies = self.bodies
+        self.velocity[:] = [body.velocity for body in bodies]
+        self.angle[:] = [body.angle for body in bodies]
+        self.angular_velocity[:] = [body.angular_velocity for body in bodies]
+
+    def write_bodies(self):
+        """
+        Copies the velocities in the arrays back to the bodies.
+        """
+        for body, velocity, angular_velocity in zip(self.bodies, self.velocity.tolist(), self.angular_velocity.tolist()):
+            body.velocity = velocity
+            body.angular_velocity = angular_velocity
+
+    def step(self):
+        """
+        The vectorized version of Tank.update, for every tank at once.
+        """
+        #  Accelerate in the direction the tank is facing
+        push = self.base_acceleration * self.acceleration
+        self.velocity[:, 0] -= push * numpy.sin(self.angle)
+        self.velocity[:, 1] += push * numpy.cos(self.angle)
+
+        #  Makes sure that we dont exceed our speed limit
+        speed = numpy.hypot(self.velocity[:, 0], self.velocity[:, 1])
+        limited = numpy.minimum(speed, self.max_speed)
+        scale = numpy.divide(limited, speed, out=numpy.zeros_like(speed), where=speed > 0)
+        self.velocity *= scale[:, None]
+
+        #  Updates the rotation
+        self.angular_velocity += self.rotation * self.base_acceleration
+        numpy.clip(self.angular_velocity, -self.max_speed, self.max_speed, out=self.angular_velocity)
+
+        #  Timers and spawn protection
+        self.shoot_last += 1
+        self.spawn_protection_timer += 1
+        self.spawn_protection &= self.spawn_protection_timer <= self.protection_time
+
+    def update(self):
+        """
+        Updates every tank, replaces calling Tank.update on each of them.
+        """
+        if not self.bodies:
+            return
+        self.read_bodies()
+        self.step()
+        self.write_bodies()
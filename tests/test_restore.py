@@ -0,0 +1,38 @@
+"""
+A round started by GameSession.restore must play exactly like the first round
+of a new session. Run from the root of the game with: python3 -m pytest tests
+"""
+import maps
+import simulation
+import sounds
+
+sounds.muted = True
+
+
+def poses(session):
+    """
+    Returns the pose of every body of a session, in the order of its space.
+    """
+    return [(tuple(body.position), body.angle, body.velocity) for body in session.space.bodies]
+
+
+def test_restored_round_plays_like_a_new_session():
+    """
+    Plays a round until boxes are destroyed, restores it and checks, tick by tick,
+    that it plays like a new session that starts with the same ticks and AI delays.
+    """
+    current_map = maps.load_map("map2")
+    played = simulation.GameSession(current_map, all_ai=True, hard_ai=True, seed=2)
+    boxes = len(played.game_objects_list)
+    played.step(450)
+    assert len(played.game_objects_list) < boxes  # Boxes were destroyed and must come back
+    played.restore()
+
+    fresh = simulation.GameSession(current_map, all_ai=True, hard_ai=True, seed=2, ticks=played.ticks)
+    for played_ai, fresh_ai in zip(played.ai_list, fresh.ai_list):
+        fresh_ai.start_delay = played_ai.start_delay
+    assert [id(obj) for obj in played.game_objects_list] == [id(obj) for obj in played.saved["objects"]]
+    for tick in range(400):
+        assert poses(played) == poses(fresh), "the rounds differ at tick %d" % tick
+        played.step(1)
+        fresh.step(1)
@@ -0,0 +1,56 @@
+"""
+The tanks of a TankStore must play like the tanks of Tank.update, with their
+state in the arrays. Run from the root of the game with: python3 -m pytest tests
+"""
+import pytest
+
+import maps
+import simulation
+import sounds
+
+pytest.importorskip("numpy")
+sounds.muted = True
+
+
+def state(tank):
+    """
+    Returns the attributes of a tank that the store keeps.
+    """
+    return (tank.acceleration, tank.rotation, tank.base_acceleration, tank.max_speed,
+            tank.shoot_last, tank.spawn_protection_timer, tank.spawn_protection, tank.hp)
+
+
+def test_stored_tanks_are_views_of_the_arrays():
+    """
+    Writing an attribute of a tank changes its entry in the arrays, and reading
+    it gives back a Python value, as for a Tank.
+    """
+    session = simulation.GameSession(maps.load_map("map0"), vectorized=True)
+    store = session.tank_store
+    tank = session.tanks_list[2]
+    tank.hp = 3
+    tank.spawn_protection = True
+    assert store.hp[2] == 3 and store.spawn_protection[2]
+    store.shoot_last[2] = 7
+    assert tank.shoot_last == 7 and type(tank.shoot_last) is int
+    assert tank.spawn_protection is True
+    assert "hp" not in vars(tank)
+
+
+@pytest.mark.parametrize("name", ["map0", "map1", "map2"])
+def test_stored_tanks_play_like_tanks(name):
+    """
+    Plays a match, new rounds included, with and without the store, and compares
+    the tanks tick by tick.
+    """
+    scalar = simulation.GameSession(maps.load_map(name), all_ai=True, hard_ai=True, seed=1)
+    stored = simulation.GameSession(maps.load_map(name), all_ai=True, hard_ai=True, seed=1, vectorized=True)
+    for tick in range(1500):
+        for session in (scalar, stored):
+            if session.winner is not None:
+                session.restore()
+            session.step(1)
+        for tank, stored_tank in zip(scalar.tanks_list, stored.tanks_list):
+            assert state(tank) == state(stored_tank), "the tanks differ at tick %d" % tick
+            assert abs(tank.body.position - stored_tank.body.position) < 1e-9, "the tanks differ at tick %d" % tick
+    assert scalar.scores == stored.scores
@@ -0,0 +1,79 @@
+"""
+Visibility.nothing_to_shoot may only skip the rays that would find nothing to
+shoot at. Run from the root of the game with: python3 -m pytest tests
+"""
+import math
+import random
+
+import pymunk
+import pytest
+
+import gameobjects
+import lineofsight
+import maps
+import simulation
+import sounds
+
+sounds.muted = True
+
+
+def would_shoot(session, tank):
+    """
+    Casts the ray of a tank in the space, returns whether it finds an enemy or a wood box.
+    """
+    start, end = lineofsight.ray(tank)
+    hit = session.space.segment_query_first(start, end, 0, pymunk.ShapeFilter())
+    if hit is None:
+        return False
+    if hit.shape.collision_type == gameobjects.TANK_COLLISION_TYPE:
+        return tank.team is None or hit.shape.parent.team != tank.team
+    return hit.shape.collision_type == gameobjects.BOX_COLLISION_TYPE and hit.shape.parent.destructable
+
+
+def check(session, tank):
+    """
+    Checks that the ray of a tank is only skipped if it finds nothing to shoot at.
+    Returns whether it was skipped.
+    """
+    skipped = session.visibility.nothing_to_shoot(tank)
+    assert not (skipped and would_shoot(session, tank)), \
+        "ray of %s at %s, angle %f skipped" % (session.current_map.name, tank.body.position, tank.body.angle)
+    return skipped
+
+
+@pytest.mark.parametrize("name, seed, coop", [("map0", 1, False), ("map1", 2, True), ("map2", 2, False), ("map3", 1, False)])
+def test_skipped_rays_find_nothing_in_a_game(name, seed, coop):
+    """
+    Compares with the space every ray of every tank of a game, tick by tick.
+    """
+    session = simulation.GameSession(maps.load_map(name), all_ai=True, hard_ai=True, seed=seed, coop=coop)
+    skipped = 0
+    for tick in range(1800):
+        if session.winner is not None:
+            session.restore()
+        session.step(1)
+        session.visibility.begin_tick()
+        for tank in session.tanks_list:
+            skipped += check(session, tank)
+    assert skipped > 0
+
+
+@pytest.mark.parametrize("name", ["custom_map", "map1", "map2"])
+def test_skipped_rays_find_nothing_anywhere(name):
+    """
+    Compares with the space the ray of a tank put anywhere on the map, facing anywhere.
+    """
+    session = simulation.GameSession(maps.load_map(name), all_ai=True, hard_ai=True)
+    draw = random.Random(name)
+    tank = session.tanks_list[0]
+    for pose in range(3000):
+        width, height = session.current_map.width, session.current_map.height
+        if draw.random() < 0.5:
+            tank.body.position = (draw.uniform(0, width), draw.uniform(0, height))
+        else:
+            tank.body.position = (draw.randrange(width) + 0.5, draw.randrange(height) + 0.5)
+        #  Some rays go along the sides of the tiles or through their corners
+        tank.body.angle = draw.choice([draw.uniform(-math.pi, math.pi), draw.randrange(-8, 9) * math.pi / 4])
+        session.space.reindex_shapes_for_body(tank.body)
+        session.visibility.begin_tick()
+        check(session, tank)
@@ -0,0 +1,125 @@
+"""
+Which rays of the AIs can not find anything to shoot at, without casting them.
+The ray of a tank (see lineofsight.ray) is followed tile by tile over the rocks
+of the map, which never move, until it goes into a rock or leaves the map. If
+no enemy and no wood box covers one of the tiles it went through, the ray could
+not hit one, and it is not cast. The other boxes and the bullets are left out:
+they can only stop a ray earlier.
+
+A table of which tiles see each other can not answer this: a ray starts anywhere
+on its tile and goes in any direction, and almost every tile of a map can be
+seen from some point of almost every other tile.
+"""
+import math
+
+import lineofsight
+
+ROCK = 1
+WOOD = 2
+CORNER_EPSILON = 1e-9  # A ray this close to a corner of a tile is taken as going through it
+
+
+class Visibility:
+    """
+    Tells the AIs of a game when their ray can not find anything to shoot at.
+    """
+
+    def __init__(self, current_map, grid, tanks_list):
+        """
+        Takes as argument the map, the occupancy grid of the game (which knows the
+        wood boxes) and its tanks.
+        """
+        self.width = current_map.width
+        self.height = current_map.height
+        self.tiles = current_map.tiles
+        self.grid = grid
+        self.tanks_list = tanks_list
+        self.targets = {}  # Tank -> bitset of the tiles under its enemies and the wood boxes, in this tick
+
+    def begin_tick(self):
+        """
+        Finds the tiles under the tanks and the wood boxes, once for all the AIs.
+        """
+        wood = 0
+        for box in self.grid.box_tiles:
+            if box.box_type == WOOD:
+                wood |= self.tiles_under(box.shape.bb)
+        tiles = [self.tiles_under(tank.shape.bb) for tank in self.tanks_list]
+        self.targets = {}
+        for tank in self.tanks_list:
+            targets = wood
+            for other, under in zip(self.tanks_list, tiles):
+                if other is not tank and (tank.team is None or other.team != tank.team):
+                    targets |= under
+            self.targets[tank] = targets
+
+    def tiles_under(self, bb):
+        """
+        Returns the bitset (bit x + y * width) of the tiles a bounding box covers.
+        """
+        left = max(int(bb.left), 0)
+        right = min(int(bb.right), self.width - 1)
+        bottom = max(int(bb.bottom), 0)
+        top = min(int(bb.top), self.height - 1)
+        mask = 0
+        for y in range(bottom, top + 1):
+            mask |= ((1 << (right - left + 1)) - 1) << (left + y * self.width)
+        return mask
+
+    def nothing_to_shoot(self, tank):
+        """
+        Returns whether the ray of the tank can not find an enemy or a wood box: none
+        of them covers a tile the ray goes through before it goes into a rock. Where
+        the ray goes through a corner, or so close to it that rounding could put it
+        on either side, the tiles on both sides are looked at and do not stop it.
+        """
+        targets = self.targets.get(tank)
+        if targets is None:
+            return False  # The tick was not begun
+        width = self.width
+        height = self.height
+        tiles = self.tiles
+        #  The same ray as lineofsight.ray, without building vectors
+        angle = tank.body.angle + math.pi / 2
+        dx = math.cos(angle)
+        dy = math.sin(angle)
+        x0, y0 = tank.body.position
+        x0 += dx * lineofsight.SIGHT_START
+        y0 += dy * lineofsight.SIGHT_START
+        length = lineofsight.SIGHT_RANGE - lineofsight.SIGHT_START
+        x = math.floor(x0)
+        y = math.floor(y0)
+        #  Distance along the ray to the next column and to the next row
+        if dx > 0:
+            sx, next_x, step_x = 1, (x + 1 - x0) / dx, 1 / dx
+        elif dx < 0:
+            sx, next_x, step_x = -1, (x0 - x) / -dx, -1 / dx
+        else:
+            sx, next_x, step_x = 0, math.inf, math.inf
+        if dy > 0:
+            sy, next_y, step_y = 1, (y + 1 - y0) / dy, 1 / dy
+        elif dy < 0:
+            sy, next_y, step_y = -1, (y0 - y) / -dy, -1 / dy
+        else:
+            sy, next_y, step_y = 0, math.inf, math.inf
+        while 0 <= x < width and 0 <= y < height:
+            tile = x + y * width
+            if targets >> tile & 1:
+                return False
+            if tiles[tile] == ROCK or min(next_x, next_y) > length:
+                return True
+            if next_x < next_y - CORNER_EPSILON:
+                x += sx
+                next_x += step_x
+            elif next_y < next_x - CORNER_EPSILON:
+                y += sy
+                next_y += step_y
+            else:
+                for side_x, side_y in ((x + sx, y), (x, y + sy)):
+                    if 0 <= side_x < width and 0 <= side_y < height and targets >> (side_x + side_y * width) & 1:
+                        return False
+                x += sx
+                y += sy
+                next_x += step_x
+                next_y += step_y
+        return True